@@ -1,23 +1,121 @@
 # app.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Query
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse, PlainTextResponse, JSONResponse, Response
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import threading
+import time
 import uvicorn
 import os
 
 # Import our previous code
 from rule_engine import RuleParser, RuleEvaluator
 from rule_database import RuleDatabase
+from rule_cache import RuleCache, ResultCache
+from rule_compiler import RuleCompiler
+from rule_schema import ATTRIBUTE_TYPES, SchemaError
+from rule_optimizer import RuleOptimizer
+from rule_adaptive import AdaptiveRule
+from rule_batcher import MicroBatcher
+from rule_network import RuleNetwork
+from rule_serializer import RuleSerializer, RuleLoader, FORMAT_VERSION
+from rule_registry import RuleRegistry
+from rule_stream import NDJSONEvaluator
+from rule_metrics import RuleMetrics, SamplingProfiler, render_prometheus, stats_families
+from rule_bulk import RuleImporter, RuleReader, export_ndjson
+from rule_cost import CostModel, CostLimits, EvaluationBudget, BudgetExceeded, DEFAULT_COSTS
 
 # Create directories if they don't exist
 os.makedirs('static', exist_ok=True)
 
-app = FastAPI(title="Rule Engine")
-rule_db = RuleDatabase('rules.db')
+@asynccontextmanager
+async def lifespan(app):
+    global profiler
+    if os.environ.get('RULE_PROFILING', '0') == '1':
+        # Requests are evaluated on the event loop thread, so that's the one sampled
+        profiler = SamplingProfiler(threading.get_ident())
+    # Condition costs are timed by the first process to start and stored,
+    # so every worker estimates a rule's cost the same way
+    costs = rule_db.get_condition_costs()
+    if any(kind not in costs for kind in DEFAULT_COSTS):
+        costs = rule_db.save_condition_costs(cost_model.calibrate())
+    cost_model.costs.update(costs)
+    # Load every rule once; reads are then served from memory and other
+    # workers' writes are picked up by polling the rules revision
+    revision = rule_db.get_revision()
+    rule_registry.load(rule_loader.load_rows(rule_db), revision, rule_db.get_schema())
+    poller = asyncio.create_task(rule_registry.poll())
+    yield
+    poller.cancel()
+    rule_importer.close()
+    rule_db.close()
+
+app = FastAPI(title="Rule Engine", lifespan=lifespan)
+rule_db = RuleDatabase('rules.db', max_workers=int(os.environ.get('RULE_DB_WORKERS', 4)))
+rule_registry = RuleRegistry(rule_db, poll_interval=float(os.environ.get('RULE_REFRESH_INTERVAL', 1.0)))
+# Stage timings and per-rule statistics for /metrics (on unless RULE_METRICS=0)
+rule_metrics = RuleMetrics() if os.environ.get('RULE_METRICS', '1') == '1' else None
+# Sampling profiler behind /api/profile (opt-in, set up in lifespan)
+profiler = None
+# Processes that validate large imports (default: one per CPU)
+rule_importer = RuleImporter(workers=int(os.environ.get('RULE_IMPORT_WORKERS', 0)) or None)
 parser = RuleParser()
 evaluator = RuleEvaluator()
+# Compilers share the registry's attribute schema, which it updates in place
+compiler = RuleCompiler(rule_registry.schema)
+optimizer = RuleOptimizer(rule_registry.schema)
+serializer = RuleSerializer()
+rule_loader = RuleLoader(parser, serializer)
+rule_cache = RuleCache(maxsize=int(os.environ.get('RULE_CACHE_SIZE', 1024)))
+result_cache = ResultCache(maxsize=int(os.environ.get('RULE_RESULT_CACHE_SIZE', 10000)),
+                           ttl=float(os.environ.get('RULE_RESULT_CACHE_TTL', 300)))
+rule_network = RuleNetwork(rule_registry.schema)
+# Limits a new rule's estimated cost must stay under, and the most one
+# evaluation may do before it is aborted (0 turns a limit off)
+cost_model = CostModel(rule_registry.schema)
+cost_limits = CostLimits(max_nodes=int(os.environ.get('RULE_MAX_NODES', 10000)),
+                         max_depth=int(os.environ.get('RULE_MAX_DEPTH', 64)),
+                         max_seconds=float(os.environ.get('RULE_MAX_COST_US', 1000)) / 1e6)
+# Rules estimated at over half the cost limit are checked against the
+# time budget as they run; cheaper ones run without checks
+evaluation_budget = EvaluationBudget(max_steps=int(os.environ.get('RULE_EVAL_MAX_STEPS', 10000)),
+                                     timeout=float(os.environ.get('RULE_EVAL_TIMEOUT_MS', 10)) / 1000,
+                                     check_above=float(os.environ.get('RULE_EVAL_CHECK_ABOVE_US',
+                                                                      cost_limits.max_seconds * 1e6 / 2)) / 1e6)
+# Reorder each rule's conditions from profiled traffic (opt-in)
+adaptive_rules = os.environ.get('RULE_ADAPTIVE', '0') == '1'
+# Coalesce concurrent /api/rules/test/ calls for the same rule (opt-in)
+micro_batcher = None
+if os.environ.get('RULE_MICROBATCH', '0') == '1':
+    micro_batcher = MicroBatcher(max_delay=float(os.environ.get('RULE_MICROBATCH_DELAY_MS', 2)) / 1000,
+                                 max_batch_size=int(os.environ.get('RULE_MICROBATCH_SIZE', 64)),
+                                 schema=rule_registry.schema)
+
+def apply_rule_changes(changed, deleted):
+    """Keep the caches and rule network in step with the registry"""
+    for name in deleted:
+        rule_cache.invalidate(name)
+        result_cache.invalidate(name)
+        if micro_batcher is not None:
+            micro_batcher.invalidate(name)
+        if rule_metrics is not None:
+            rule_metrics.forget(name)
+        rule_network.remove_rule(name)
+    for rule in changed:
+        rule_cache.invalidate(rule['name'])
+        result_cache.invalidate(rule['name'])
+        if micro_batcher is not None:
+            micro_batcher.invalidate(rule['name'])
+        try:
+            rule_network.update_rule(rule, load_rule_ast(rule))
+        except ValueError as e:
+            print(f"Skipping rule {rule['name']}: {e}")
+            rule_network.remove_rule(rule['name'])
+
+rule_registry.subscribe(apply_rule_changes)
 
 # Pydantic models for request/response
 class RuleCreate(BaseModel):
@@ -29,48 +127,356 @@ class RuleTest(BaseModel):
     rule_name: str
     user_data: Dict[str, Any]
 
+class RuleBatchTest(BaseModel):
+    rule_name: str
+    records: List[Dict[str, Any]]
+
+class RuleMatch(BaseModel):
+    user_data: Dict[str, Any]
+
+class RuleMatchChanges(BaseModel):
+    user_data: Dict[str, Any]
+    changed_fields: List[str]
+    previous_matches: List[str]
+
+class AttributeType(BaseModel):
+    type: str
+
+class RequestStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body is produced while the request body is
+    still being read. Starlette's version listens for disconnects on the
+    same receive channel and would swallow request chunks; here a client
+    disconnect ends request.stream() instead. Each send waits on the
+    server's flow control, so a slow reader slows down how fast the
+    request body is consumed.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value matches etag, comparing weakly"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+def load_rule_ast(rule):
+    """Load a rule row's tree (from its stored blob when possible) and optimize it"""
+    return optimizer.optimize(rule_loader.load(rule))[0]
+
+def compile_rule_row(rule):
+    """
+    Load, optimize and compile a rule row. A rule whose estimated cost
+    could take it over the evaluation budget is compiled with budget checks.
+    """
+    rule_ast = load_rule_ast(rule)
+    if evaluation_budget.applies(cost_model.estimate(rule_ast)):
+        return evaluation_budget.compile_rule(rule_ast, rule_registry.schema)
+    if adaptive_rules:
+        return AdaptiveRule(rule_ast, schema=rule_registry.schema)
+    return compiler.compile_rule(rule_ast)
+
 # API Routes
 @app.post("/api/rules/", response_model=dict)
 async def create_rule(rule: RuleCreate):
     try:
-        # Validate rule by parsing it
-        parser.parse_rule(rule.rule_text)
+        # Validate rule by parsing it and checking it against the schema
+        rule_ast = parser.parse_rule(rule.rule_text)
+        compiler.check_schema(rule_ast)
+        rule_ast, eliminated = optimizer.optimize(rule_ast)
+        # Refuse rules too big or too slow to evaluate, as they will run
+        cost = cost_model.estimate(rule_ast)
+        cost_limits.check(cost)
         
-        # Save to database
-        rule_id = rule_db.save_rule(rule.name, rule.rule_text, rule.description)
+        # Save to database; the stored tree is the optimized one
+        rule_id = await rule_db.save_rule_async(rule.name, rule.rule_text, rule.description,
+                                                serializer.dumps(rule_ast), FORMAT_VERSION)
+        await rule_registry.refresh_async()
         if rule_id:
-            return {"message": "Rule created successfully", "id": rule_id}
+            return {"message": "Rule created successfully", "id": rule_id, "nodes_eliminated": eliminated,
+                    "cost": cost.as_dict()}
         raise HTTPException(status_code=400, detail="Failed to create rule")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/rules/", response_model=List[dict])
-async def get_rules():
-    return rule_db.get_all_rules()
+async def get_rules(request: Request, after: Optional[int] = Query(None),
+                    limit: int = Query(100, ge=1, le=1000)):
+    """
+    One page of rules in id order, starting after the rule id in after.
+    The Link header points to the next page. The ETag changes whenever any
+    rule does, so an unchanged catalog costs a 304 to revalidate.
+    """
+    etag = f'"{rule_registry.revision}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    rules, next_after = rule_registry.get_rules_page(after, limit)
+    if next_after is not None:
+        headers["Link"] = f'<{request.url.include_query_params(after=next_after, limit=limit)}>; rel="next"'
+    return JSONResponse(rules, headers=headers)
+
+@app.post("/api/rules/import/", response_model=dict)
+async def import_rules(request: Request):
+    """
+    Create or replace every rule in a newline-delimited JSON body. Rules
+    are validated in parallel and written in one transaction; if any is
+    invalid, none are written.
+    """
+    reader = RuleReader()
+    await reader.read_stream(request.stream())
+    entries, errors = reader.entries, reader.errors
+    results = await rule_importer.validate_async([rule for _, rule in entries], dict(rule_registry.schema),
+                                                 dict(cost_model.costs), cost_limits)
+
+    rows = []
+    for (line, rule), (row, error) in zip(entries, results):
+        if error is not None:
+            errors.append({"line": line, "name": rule[0], "error": error})
+        else:
+            rows.append(row)
+    if errors:
+        errors.sort(key=lambda error: error["line"])
+        raise HTTPException(status_code=400, detail={"message": f"{len(errors)} invalid rules; nothing was imported",
+                                                     "errors": errors})
+    if not rows:
+        raise HTTPException(status_code=400, detail="No rules to import")
+
+    imported = await rule_db.save_rules_async(rows)
+    await rule_registry.refresh_async()
+    if imported is None:
+        raise HTTPException(status_code=400, detail="Failed to import rules")
+    return {"message": "Rules imported successfully", "imported": imported}
+
+@app.get("/api/rules/export/")
+async def export_rules():
+    """Stream every rule as newline-delimited JSON, in the format /api/rules/import/ reads"""
+    return StreamingResponse(export_ndjson(rule_registry.get_all_rules()), media_type="application/x-ndjson")
 
 @app.post("/api/rules/test/", response_model=dict)
 async def test_rule(test_data: RuleTest):
+    rule = None
+    start = time.perf_counter()
     try:
-        # Get rule from database
-        rule = rule_db.get_rule(test_data.rule_name)
+        # Get rule from the in-memory registry
+        rule = rule_registry.get_rule(test_data.rule_name)
         if not rule:
             raise HTTPException(status_code=404, detail="Rule not found")
+        looked_up = time.perf_counter()
             
-        # Parse and evaluate rule
-        rule_ast = parser.parse_rule(rule['rule_text'])
-        result = evaluator.evaluate_rule(rule_ast, test_data.user_data)
+        # Parse and compile the rule only if this version is not cached yet
+        compiled = rule_cache.get_or_compile(rule, compile_rule_row)
+        compiled_at = time.perf_counter()
+        # Repeated profiles are answered from the result cache
+        version = RuleCache.version_of(rule)
+        if micro_batcher is None:
+            result = result_cache.evaluate(rule['name'], version, compiled, test_data.user_data)
+        else:
+            key, result = result_cache.lookup(rule['name'], version, compiled, test_data.user_data)
+            if result is None:
+                result = await micro_batcher.evaluate(rule['name'], version, compiled, test_data.user_data)
+                result_cache.store(key, result)
+
+        if rule_metrics is not None:
+            done = time.perf_counter()
+            rule_metrics.observe_stage('lookup', looked_up - start)
+            rule_metrics.observe_stage('compile', compiled_at - looked_up)
+            rule_metrics.observe_stage('evaluate', done - compiled_at)
+            rule_metrics.observe_rule(rule['name'], done - compiled_at, result)
         
         return {
             "rule_name": test_data.rule_name,
             "user_data": test_data.user_data,
             "result": result
         }
+    except BudgetExceeded as e:
+        # Neither a match nor a non-match, so it gets its own status
+        if rule_metrics is not None:
+            rule_metrics.observe_abort(rule['name'])
+        raise HTTPException(status_code=422, detail=f"Evaluation aborted: {e}")
+    except Exception as e:
+        if rule_metrics is not None and rule:
+            rule_metrics.observe_error(rule['name'])
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/rules/batch-test/", response_model=dict)
+async def batch_test_rule(batch: RuleBatchTest):
+    """Evaluate one rule against many records, returning only the matching indices"""
+    rule = rule_registry.get_rule(batch.rule_name)
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+
+    try:
+        compiled = rule_cache.get_or_compile(rule, compile_rule_row)
+        start = time.perf_counter()
+        matches = compiled.match_indices(batch.records)
+    except BudgetExceeded as e:
+        if rule_metrics is not None:
+            rule_metrics.observe_abort(rule['name'])
+        raise HTTPException(status_code=422, detail=f"Evaluation aborted: {e}")
     except Exception as e:
+        if rule_metrics is not None:
+            rule_metrics.observe_error(rule['name'])
         raise HTTPException(status_code=400, detail=str(e))
+    if rule_metrics is not None:
+        rule_metrics.observe_stage('batch_evaluate', time.perf_counter() - start)
+        rule_metrics.observe_batch(rule['name'], len(batch.records), len(matches))
+
+    return {
+        "rule_name": batch.rule_name,
+        "total": len(batch.records),
+        "match_count": len(matches),
+        "matches": matches
+    }
+
+@app.post("/api/rules/stream-test/")
+async def stream_test_rules(request: Request, rules: List[str] = Query(...)):
+    """
+    Evaluate the named rules against newline-delimited JSON records in the
+    request body, streaming one result line per record
+    """
+    compiled_rules = []
+    for name in rules:
+        rule = rule_registry.get_rule(name)
+        if not rule:
+            raise HTTPException(status_code=404, detail=f"Rule not found: {name}")
+        try:
+            compiled_rules.append(rule_cache.get_or_compile(rule, compile_rule_row))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    stream = NDJSONEvaluator(compiled_rules).evaluate_stream(request.stream())
+    return RequestStreamingResponse(stream, media_type="application/x-ndjson")
+
+@app.post("/api/rules/match/", response_model=dict)
+async def match_rules(match: RuleMatch):
+    """Return every stored rule that user_data satisfies"""
+    start = time.perf_counter()
+    matches = rule_network.match(match.user_data)
+    if rule_metrics is not None:
+        rule_metrics.observe_stage('match', time.perf_counter() - start)
+    return {
+        "match_count": len(matches),
+        "matches": matches
+    }
+
+@app.post("/api/rules/match/changes/", response_model=dict)
+async def match_rule_changes(change: RuleMatchChanges):
+    """
+    Re-evaluate only the rules that read one of changed_fields, returning
+    the rules whose result differs from previous_matches
+    """
+    changes = rule_network.evaluate_changes(change.user_data, change.changed_fields, set(change.previous_matches))
+    return {
+        "matched": sorted(name for name, matched in changes.items() if matched),
+        "unmatched": sorted(name for name, matched in changes.items() if not matched)
+    }
+
+@app.get("/api/rules/cache/stats", response_model=dict)
+async def get_cache_stats():
+    return rule_cache.stats()
+
+@app.get("/api/rules/cache/results/stats", response_model=dict)
+async def get_result_cache_stats():
+    return result_cache.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Stage timings, per-rule statistics and cache counters in Prometheus text format"""
+    families = rule_metrics.families() if rule_metrics is not None else []
+    families.append(('rule_engine_rules', 'gauge', 'Rules loaded', [('', '', len(rule_registry.get_all_rules()))]))
+    families += stats_families('rule_engine_rule_cache', 'Compiled rule cache', rule_cache.stats(),
+                               counters=('hits', 'misses', 'evictions'))
+    families += stats_families('rule_engine_result_cache', 'Result cache', result_cache.stats(),
+                               counters=('hits', 'misses', 'evictions', 'expirations', 'uncacheable'))
+    families += stats_families('rule_engine_network', 'Rule network', rule_network.stats())
+    if micro_batcher is not None:
+        families += stats_families('rule_engine_microbatch', 'Micro-batcher', micro_batcher.stats(),
+                                   counters=('batches', 'records'))
+    return PlainTextResponse(render_prometheus(families), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/profile")
+async def get_profile(seconds: float = Query(5.0, gt=0, le=60), interval_ms: float = Query(5.0, ge=1, le=1000)):
+    """
+    Sample the event loop thread for seconds and return the stacks in
+    folded format, for flamegraph.pl or speedscope
+    """
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set RULE_PROFILING=1)")
+    try:
+        folded, samples, idle = await asyncio.to_thread(profiler.profile, seconds, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(folded, headers={"X-Samples": str(samples), "X-Idle-Samples": str(idle)})
+
+@app.get("/api/rules/{rule_name}/plan", response_model=dict)
+async def get_rule_plan(rule_name: str):
+    """The condition order a rule is evaluated in and its observed pass rates"""
+    rule = rule_registry.get_rule(rule_name)
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    if not adaptive_rules:
+        raise HTTPException(status_code=400, detail="Adaptive evaluation is disabled (set RULE_ADAPTIVE=1)")
+    return rule_cache.get_or_compile(rule, compile_rule_row).stats()
+
+@app.get("/api/rules/{rule_name}/cost", response_model=dict)
+async def get_rule_cost(rule_name: str):
+    """A rule's size and estimated evaluation cost, against the configured limits"""
+    rule = rule_registry.get_rule(rule_name)
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    try:
+        cost = cost_model.estimate(load_rule_ast(rule))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return dict(cost.as_dict(), limits=cost_limits.as_dict(), budget_checked=evaluation_budget.applies(cost))
+
+@app.get("/api/schema", response_model=dict)
+async def get_schema():
+    return dict(rule_registry.schema)
+
+@app.put("/api/schema/{field}", response_model=dict)
+async def set_attribute_type(field: str, attribute: AttributeType):
+    """Declare the type of an attribute; refused if a stored rule doesn't fit it"""
+    if attribute.type not in ATTRIBUTE_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown type {attribute.type!r}; expected one of {', '.join(ATTRIBUTE_TYPES)}")
+
+    checker = RuleCompiler(dict(rule_registry.schema, **{field: attribute.type}))
+    errors = []
+    for listed in rule_registry.get_all_rules():
+        try:
+            rule_ast = parser.parse_rule(listed['rule_text'])
+        except ValueError:
+            continue    # Never loaded, so never compiled against the schema
+        try:
+            checker.check_schema(rule_ast)
+        except SchemaError as e:
+            errors.append(f"{listed['name']}: {e}")
+    if errors:
+        raise HTTPException(status_code=400, detail='; '.join(errors))
+
+    await rule_db.set_attribute_type_async(field, attribute.type)
+    await rule_registry.refresh_async()
+    return {"message": "Attribute type saved", "schema": dict(rule_registry.schema)}
+
+@app.delete("/api/schema/{field}")
+async def delete_attribute_type(field: str):
+    deleted = await rule_db.delete_attribute_type_async(field)
+    await rule_registry.refresh_async()
+    if deleted:
+        return {"message": "Attribute type removed"}
+    raise HTTPException(status_code=404, detail="Attribute not in schema")
 
 @app.delete("/api/rules/{rule_name}")
 async def delete_rule(rule_name: str):
-    if rule_db.delete_rule(rule_name):
+    deleted = await rule_db.delete_rule_async(rule_name)
+    await rule_registry.refresh_async()
+    if deleted:
         return {"message": "Rule deleted successfully"}
     raise HTTPException(status_code=404, detail="Rule not found")
 
@@ -151,8 +557,16 @@ async def get_index():
             // Load rules on page load
             async function loadRules() {
                 try {
-                    const response = await fetch('/api/rules/');
-                    const rules = await response.json();
+                    // Follow the Link header through every page; unchanged
+                    // pages are revalidated with their ETag
+                    let rules = [];
+                    let url = '/api/rules/?limit=1000';
+                    while (url) {
+                        const response = await fetch(url);
+                        rules = rules.concat(await response.json());
+                        const next = /<([^>]+)>;\\s*rel="next"/.exec(response.headers.get('Link') || '');
+                        url = next ? next[1] : null;
+                    }
                     
                     // Update rules list
                     const rulesList = document.getElementById('rulesList');
@@ -0,0 +1,368 @@
+# benchmark_suite.py
+"""
+Reproducible benchmark suite with machine-readable results.
+
+    python benchmark_suite.py --output results.json
+    python benchmark_suite.py --quick --output new.json --compare results.json
+
+Rules and records come from the seeded generators in benchmarks.py, so two
+runs with the same --seed measure the same work. Every case runs --repeat
+times and reports the median. Results are written as JSON, one entry per
+(benchmark, case) with its parameters and metrics.
+
+Metric names say which way is better: *_per_sec is higher-better, *_us and
+*_ms lower-better. With --compare, metrics that got worse by more than
+--threshold against an earlier results file are listed and the exit
+status is 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from rule_engine import RuleParser, RuleEvaluator
+from rule_compiler import RuleCompiler
+from rule_network import RuleNetwork
+from rule_database import RuleDatabase
+from benchmarks import make_rule_set, make_records, _percentile
+
+SUITE_VERSION = 1
+
+# Sizes for each benchmark; --quick runs the smaller set
+FULL = {
+    'parse': {'shapes': [(10, 1), (10, 3), (100, 3), (100, 6), (1000, 6)], 'rules': 200},
+    'evaluate': {'shapes': [(10, 1), (10, 3), (100, 3), (100, 6)], 'rules': 10, 'records': 2000},
+    'network': {'overlaps': [0.0, 0.5, 0.9], 'rules': 1000, 'size': 6, 'depth': 2, 'records': 2000},
+    'database': {'threads': [1, 4, 8], 'rules': 1000, 'ops': 2000, 'write_ratio': 0.1},
+    'http': {'clients': [1, 16, 64], 'rules': 100, 'size': 10, 'depth': 3, 'records': 2000, 'duration': 2.0}
+}
+QUICK = {
+    'parse': {'shapes': [(10, 1), (100, 3)], 'rules': 50},
+    'evaluate': {'shapes': [(10, 1), (100, 3)], 'rules': 5, 'records': 500},
+    'network': {'overlaps': [0.0, 0.9], 'rules': 200, 'size': 6, 'depth': 2, 'records': 500},
+    'database': {'threads': [1, 4], 'rules': 200, 'ops': 500, 'write_ratio': 0.1},
+    'http': {'clients': [1, 16], 'rules': 20, 'size': 10, 'depth': 3, 'records': 500, 'duration': 0.5}
+}
+
+def _median_time(fn, repeat):
+    """Run fn once to warm up, then repeat times, and return the median elapsed seconds"""
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def _result(benchmark, params, metrics):
+    case = ','.join(f'{key}={value}' for key, value in params.items())
+    return {
+        'benchmark': benchmark,
+        'case': case,
+        'params': params,
+        'metrics': {name: round(value, 3) if isinstance(value, float) else value for name, value in metrics.items()}
+    }
+
+def bench_parse(config, seed, repeat):
+    """RuleParser.parse_rule throughput by rule size and nesting depth"""
+    parser = RuleParser()
+    results = []
+    for size, depth in config['shapes']:
+        rules = make_rule_set(config['rules'], size, depth, seed=seed)
+        elapsed = _median_time(lambda: [parser.parse_rule(rule) for rule in rules], repeat)
+        results.append(_result('parse', {'size': size, 'depth': depth}, {
+            'rules_per_sec': len(rules) / elapsed,
+            'conditions_per_sec': len(rules) * size / elapsed,
+            'mean_us': elapsed / len(rules) * 1e6
+        }))
+    return results
+
+def bench_evaluate(config, seed, repeat):
+    """RuleEvaluator.evaluate_rule and compiled rule throughput by rule shape"""
+    parser = RuleParser()
+    evaluator = RuleEvaluator()
+    compiler = RuleCompiler()
+    records = make_records(config['records'], seed)
+    results = []
+    for size, depth in config['shapes']:
+        rules = [parser.parse_rule(rule) for rule in make_rule_set(config['rules'], size, depth, seed=seed)]
+        compiled = [compiler.compile_rule(rule) for rule in rules]
+        evaluations = len(rules) * len(records)
+
+        interpreted = _median_time(lambda: [evaluator.evaluate_rule(rule, record) for rule in rules for record in records], repeat)
+        fast = _median_time(lambda: [rule.evaluate(record) for rule in compiled for record in records], repeat)
+        matches = sum(rule.evaluate(record) for rule in compiled for record in records)
+        results.append(_result('evaluate', {'size': size, 'depth': depth}, {
+            'interpreted_per_sec': evaluations / interpreted,
+            'compiled_per_sec': evaluations / fast,
+            'interpreted_us': interpreted / evaluations * 1e6,
+            'compiled_us': fast / evaluations * 1e6,
+            'match_rate': matches / evaluations
+        }))
+    return results
+
+def bench_network(config, seed, repeat):
+    """Matching a record against every rule at once, by predicate overlap between rules"""
+    records = make_records(config['records'], seed)
+    results = []
+    for overlap in config['overlaps']:
+        texts = make_rule_set(config['rules'], config['size'], config['depth'], overlap, seed=seed)
+        rules = [{'id': i + 1, 'name': f'rule{i}', 'rule_text': text, 'revision': 1} for i, text in enumerate(texts)]
+
+        network = None
+        def build():
+            nonlocal network
+            network = RuleNetwork()
+            for rule in rules:
+                network.update_rule(rule)
+        build_time = _median_time(build, repeat)
+        match_time = _median_time(lambda: [network.match(record) for record in records], repeat)
+        stats = network.stats()
+        results.append(_result('network', {'rules': len(rules), 'overlap': overlap}, {
+            'records_per_sec': len(records) / match_time,
+            'match_us': match_time / len(records) * 1e6,
+            'build_ms': build_time * 1000,
+            'predicates': stats['predicates'],
+            'shared_predicate_ratio': 1 - stats['predicates'] / stats['predicate_references']
+        }))
+    return results
+
+def bench_database(config, seed, repeat):
+    """RuleDatabase get_rule/save_rule ops under concurrency"""
+    texts = make_rule_set(config['rules'], 5, 2, seed=seed)
+    names = [f'rule{i}' for i in range(len(texts))]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db = RuleDatabase(os.path.join(tmp, 'benchmark.db'))
+        for name, text in zip(names, texts):
+            db.save_rule(name, text, 'benchmark')
+
+        for thread_count in config['threads']:
+            runs = []
+            for run in range(repeat):
+                latencies = []
+                def worker(index):
+                    rng = random.Random(seed * 1000 + run * 100 + index)
+                    own = []
+                    for _ in range(config['ops']):
+                        i = rng.randrange(len(names))
+                        start = time.perf_counter()
+                        if rng.random() < config['write_ratio']:
+                            db.save_rule(names[i], texts[i], 'benchmark')
+                        else:
+                            db.get_rule(names[i])
+                        own.append(time.perf_counter() - start)
+                    latencies.extend(own)
+
+                threads = [threading.Thread(target=worker, args=(i,)) for i in range(thread_count)]
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                runs.append((time.perf_counter() - start, latencies))
+
+            elapsed, latencies = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+            results.append(_result('database', {'threads': thread_count, 'write_ratio': config['write_ratio']}, {
+                'ops_per_sec': len(latencies) / elapsed,
+                'p50_us': _percentile(latencies, 0.5) * 1e6,
+                'p99_us': _percentile(latencies, 0.99) * 1e6
+            }))
+        db.close()
+    return results
+
+async def _http_load(send, clients, duration):
+    """Run clients concurrent callers of send(i) for duration seconds; returns (requests/sec, latencies, errors)"""
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(offset):
+        nonlocal errors
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            # The in-process transport never waits on a socket; give the
+            # loop a turn per request so clients interleave as they would
+            await asyncio.sleep(0)
+            response = await send(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+            i += clients
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    return len(latencies) / (time.perf_counter() - start), latencies, errors
+
+async def _run_http(app, httpx, config, seed, repeat):
+    texts = make_rule_set(config['rules'], config['size'], config['depth'], seed=seed)
+    records = make_records(config['records'], seed)
+    results = []
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+            start = time.perf_counter()
+            for i, text in enumerate(texts):
+                response = await client.post('/api/rules/', json={
+                    'name': f'rule{i}', 'description': 'benchmark', 'rule_text': text})
+                response.raise_for_status()
+            elapsed = time.perf_counter() - start
+            results.append(_result('http', {'endpoint': 'POST /api/rules/', 'clients': 1}, {
+                'requests_per_sec': len(texts) / elapsed,
+                'mean_ms': elapsed / len(texts) * 1000
+            }))
+
+            endpoints = {
+                'POST /api/rules/test/': lambda i: client.post('/api/rules/test/', json={
+                    'rule_name': f'rule{i % len(texts)}', 'user_data': records[i % len(records)]}),
+                'POST /api/rules/match/': lambda i: client.post('/api/rules/match/', json={
+                    'user_data': records[i % len(records)]}),
+                'GET /api/rules/': lambda i: client.get('/api/rules/')
+            }
+            for endpoint, send in endpoints.items():
+                for clients in config['clients']:
+                    runs = [await _http_load(send, clients, config['duration']) for _ in range(repeat)]
+                    throughput, latencies, errors = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+                    results.append(_result('http', {'endpoint': endpoint, 'clients': clients}, {
+                        'requests_per_sec': throughput,
+                        'p50_ms': _percentile(latencies, 0.5) * 1000,
+                        'p99_ms': _percentile(latencies, 0.99) * 1000,
+                        'errors': errors
+                    }))
+    return results
+
+def bench_http(config, seed, repeat):
+    """End-to-end requests against the FastAPI app through an in-process client"""
+    try:
+        import httpx
+    except ImportError:
+        return [{'benchmark': 'http', 'case': 'skipped', 'params': {}, 'metrics': {},
+                 'skipped': 'httpx is not installed'}]
+
+    # The app opens rules.db in the working directory, so run it in a scratch one
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            import app as app_module
+            return asyncio.run(_run_http(app_module.app, httpx, config, seed, repeat))
+        finally:
+            os.chdir(cwd)
+
+BENCHMARKS = {
+    'parse': bench_parse,
+    'evaluate': bench_evaluate,
+    'network': bench_network,
+    'database': bench_database,
+    'http': bench_http
+}
+
+def _environment():
+    environment = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+    try:
+        environment['git_commit'] = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return environment
+
+def run_suite(seed=42, quick=False, repeat=3, only=None):
+    """Run the selected benchmarks (all by default) and return the results document"""
+    config = QUICK if quick else FULL
+    started_at = datetime.now(timezone.utc).isoformat()
+    results = []
+    for name, bench in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        print(f"Running {name}...", file=sys.stderr)
+        results.extend(bench(config[name], seed, repeat))
+    return {
+        'suite_version': SUITE_VERSION,
+        'started_at': started_at,
+        'environment': _environment(),
+        'settings': {'seed': seed, 'quick': quick, 'repeat': repeat},
+        'results': results
+    }
+
+def _direction(metric):
+    """1 if a larger value is better, -1 if smaller is better, 0 if neither"""
+    if metric.endswith('_per_sec'):
+        return 1
+    if metric.endswith(('_us', '_ms')):
+        return -1
+    return 0
+
+def compare_results(previous, current, threshold=0.1):
+    """
+    Return a dict per metric that got worse by more than threshold (a
+    fraction) between two results documents
+    """
+    before = {(result['benchmark'], result['case']): result['metrics'] for result in previous['results']}
+    regressions = []
+    for result in current['results']:
+        old_metrics = before.get((result['benchmark'], result['case']), {})
+        for metric, value in result['metrics'].items():
+            old = old_metrics.get(metric)
+            direction = _direction(metric)
+            if not direction or not old:
+                continue
+            change = (value - old) / old
+            if change * direction < -threshold:
+                regressions.append({
+                    'benchmark': result['benchmark'],
+                    'case': result['case'],
+                    'metric': metric,
+                    'previous': old,
+                    'current': value,
+                    'change': round(change, 3)
+                })
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and write JSON results")
+    parser.add_argument('--output', help="File to write results to (default: stdout)")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for the rule and record generators (default: 42)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case; the median is reported (default: 3)")
+    parser.add_argument('--quick', action='store_true', help="Smaller sizes, for a fast check")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="Benchmarks to run (default: all)")
+    parser.add_argument('--compare', help="Earlier results file to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Relative change that counts as a regression (default: 0.1)")
+    args = parser.parse_args(argv)
+
+    document = run_suite(args.seed, args.quick, args.repeat, args.only)
+    text = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), document, args.threshold)
+        for regression in regressions:
+            print(f"Regression in {regression['benchmark']} [{regression['case']}] {regression['metric']}: "
+                  f"{regression['previous']} -> {regression['current']} ({regression['change']:+.1%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,987 @@
+# benchmarks.py
+import asyncio
+import csv
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+from rule_engine import RuleParser, RuleEvaluator, RuleNode
+from rule_compiler import RuleCompiler
+from rule_vectorized import VectorizedEvaluator, ColumnBatch
+from rule_network import RuleNetwork
+from rule_database import RuleDatabase
+from rule_serializer import RuleSerializer, RuleLoader, FORMAT_VERSION
+from rule_batch import evaluate_file
+from rule_sql import RuleQuery
+from rule_cache import ResultCache
+from rule_optimizer import RuleOptimizer
+from rule_adaptive import AdaptiveRule, rule_to_text, ProfilingCompiler
+from rule_batcher import MicroBatcher
+from rule_metrics import RuleMetrics, SamplingProfiler, render_prometheus
+from rule_registry import RuleRegistry
+from rule_bulk import RuleImporter, validate_rules, read_ndjson_rules, export_ndjson
+from rule_cost import CostModel, EvaluationBudget, BudgetExceeded
+
+DEPARTMENTS = ['Sales', 'Marketing', 'Engineering', 'HR', 'Finance']
+
+def make_users(count, seed=42):
+    """Generate reproducible user records"""
+    rng = random.Random(seed)
+    return [{
+        'name': f'user{i}',
+        'age': rng.randint(18, 65),
+        'department': rng.choice(DEPARTMENTS),
+        'salary': rng.randint(30000, 120000),
+        'experience': rng.randint(0, 40)
+    } for i in range(count)]
+
+def make_user_columns(count, seed=42):
+    """Generate reproducible user records as NumPy columns"""
+    rng = np.random.default_rng(seed)
+    return ColumnBatch({
+        'age': rng.integers(18, 66, count),
+        'department': np.array(DEPARTMENTS)[rng.integers(0, len(DEPARTMENTS), count)],
+        'salary': rng.integers(30000, 120001, count),
+        'experience': rng.integers(0, 41, count)
+    })
+
+def make_rule_text(clause_count, seed=42):
+    """Generate an AND of conditions and OR pairs with clause_count conditions in total"""
+    rng = random.Random(seed)
+    groups = []
+    remaining = clause_count
+    while remaining > 0:
+        if remaining >= 2 and rng.random() < 0.5:
+            groups.append(f"(salary >= {rng.randint(30000, 120000)} OR department = '{rng.choice(DEPARTMENTS)}')")
+            remaining -= 2
+        else:
+            groups.append(f"age > {rng.randint(18, 65)}")
+            remaining -= 1
+    return ' AND '.join(groups)
+
+def rule_fields(extra_fields=0):
+    """Fields generated conditions read; extra_fields adds attr0, attr1, ..."""
+    return ['age', 'salary', 'experience', 'department'] + [f'attr{n}' for n in range(extra_fields)]
+
+def make_condition(rng, fields):
+    """Generate one condition on a random field, with a literal in that field's range"""
+    field = rng.choice(fields)
+    if field.startswith('attr'):
+        return f"{field} {rng.choice(['>', '<', '>=', '<='])} {rng.randint(0, 100)}"
+    if field == 'department':
+        return f"department {rng.choice(['=', '!='])} '{rng.choice(DEPARTMENTS)}'"
+    if field == 'age':
+        return f"age {rng.choice(['>', '<', '>=', '<='])} {rng.randint(18, 65)}"
+    if field == 'salary':
+        return f"salary {rng.choice(['>', '<', '>=', '<='])} {rng.randrange(30000, 120001, 5000)}"
+    return f"experience {rng.choice(['>', '<', '>=', '<='])} {rng.randint(0, 40)}"
+
+def make_rule_catalog(rule_count, condition_count=500, seed=42, extra_fields=0):
+    """
+    Generate rule rows whose conditions are drawn from a shared pool.
+    extra_fields adds numeric fields attr0, attr1, ... (values 0-100) to the pool.
+    """
+    rng = random.Random(seed)
+    fields = rule_fields(extra_fields)
+    pool = [make_condition(rng, fields) for _ in range(condition_count)]
+
+    rules = []
+    for i in range(rule_count):
+        conditions = rng.sample(pool, rng.randint(1, 4))
+        if len(conditions) > 2 and rng.random() < 0.5:
+            rule_text = f"({conditions[0]} OR {conditions[1]}) AND " + ' AND '.join(conditions[2:])
+        else:
+            rule_text = ' AND '.join(conditions)
+        rules.append({'id': i + 1, 'name': f'rule{i}', 'rule_text': rule_text, 'revision': i + 1})
+    return rules
+
+def make_nested_rule_text(size, depth, rng, pool=None, overlap=0.0, fields=None):
+    """
+    Generate a rule with size conditions nested depth levels deep, with AND
+    and OR alternating by level (AND at the top). Each condition is taken
+    from pool with probability overlap and generated fresh otherwise.
+    """
+    fields = fields or rule_fields()
+
+    def condition():
+        if pool and rng.random() < overlap:
+            return rng.choice(pool)
+        return make_condition(rng, fields)
+
+    def build(size, depth, op):
+        if depth <= 1 or size < 2:
+            return f' {op} '.join(condition() for _ in range(size))
+        # Split the conditions between 2-4 children, each at least one deep
+        parts = min(size, rng.randint(2, 4))
+        cuts = sorted(rng.sample(range(1, size), parts - 1))
+        sizes = [b - a for a, b in zip([0] + cuts, cuts + [size])]
+        child_op = 'OR' if op == 'AND' else 'AND'
+        children = []
+        for child_size in sizes:
+            child = build(child_size, depth - 1, child_op)
+            children.append(f'({child})' if child_size > 1 else child)
+        return f' {op} '.join(children)
+
+    return build(size, depth, 'AND')
+
+def make_rule_set(rule_count, size, depth, overlap=0.5, seed=42, pool_size=200, extra_fields=0):
+    """
+    Generate rule_count rule texts of the given size and depth. overlap is
+    the fraction of conditions drawn from a pool shared by all the rules,
+    which is how many predicates rules have in common.
+    """
+    rng = random.Random(seed)
+    fields = rule_fields(extra_fields)
+    pool = [make_condition(rng, fields) for _ in range(pool_size)]
+    return [make_nested_rule_text(size, depth, rng, pool, overlap, fields) for _ in range(rule_count)]
+
+def make_records(count, seed=42, extra_fields=0, missing=0.0):
+    """
+    Generate user records like make_users, with numeric fields attr0, attr1,
+    ... (values 0-100) added and each field left out with probability missing
+    """
+    rng = random.Random(seed + 1)
+    records = make_users(count, seed)
+    for record in records:
+        for n in range(extra_fields):
+            record[f'attr{n}'] = rng.randint(0, 100)
+        if missing:
+            for field in list(record):
+                if field != 'name' and rng.random() < missing:
+                    del record[field]
+    return records
+
+def _time_per_record(fn, users):
+    start = time.perf_counter()
+    results = [fn(user) for user in users]
+    elapsed = time.perf_counter() - start
+    return results, elapsed / len(users)
+
+def benchmark_compiled_evaluation(record_count=50000):
+    """Compare RuleEvaluator.evaluate_rule with compiled closures per record"""
+    parser = RuleParser()
+    evaluator = RuleEvaluator()
+    compiler = RuleCompiler()
+    users = make_users(record_count)
+
+    rules = [
+        ("Simple AND rule", "age > 30 AND department = 'Sales'"),
+        ("Simple OR rule", "age < 25 OR department = 'Marketing'"),
+        ("Complex rule", "(age > 25 AND salary >= 50000) OR department = 'Marketing'"),
+        ("Long AND chain", "age > 20 AND salary > 40000 AND experience >= 2 AND department != 'HR' AND age < 60")
+    ]
+
+    print(f"\nCompiled vs interpreted evaluation ({record_count} records)")
+    for rule_name, rule_text in rules:
+        rule = parser.parse_rule(rule_text)
+        compiled = compiler.compile_rule(rule)
+
+        expected, interpreted = _time_per_record(lambda u: evaluator.evaluate_rule(rule, u), users)
+        actual, fast = _time_per_record(compiled.evaluate, users)
+        assert actual == expected, f"compiled rule disagrees with evaluator: {rule_text}"
+
+        print(f"{rule_name}: interpreted {interpreted * 1e6:.2f} us/record, "
+              f"compiled {fast * 1e6:.2f} us/record, speedup {interpreted / fast:.1f}x")
+
+def benchmark_parser(clause_counts=(1000, 10000, 100000)):
+    """Parse time for generated rules; time per clause should stay flat"""
+    parser = RuleParser()
+    compiler = RuleCompiler()
+    users = make_users(1000)
+
+    print("\nParsing large rules")
+    for clause_count in clause_counts:
+        rule_text = make_rule_text(clause_count)
+        start = time.perf_counter()
+        rule = parser.parse_rule(rule_text)
+        elapsed = time.perf_counter() - start
+
+        compiled = compiler.compile_rule(rule)
+        _, per_record = _time_per_record(compiled.evaluate, users)
+        print(f"{clause_count} clauses ({len(rule_text)} chars): parsed in {elapsed * 1000:.1f} ms, "
+              f"{elapsed / clause_count * 1e6:.2f} us/clause, evaluated in {per_record * 1e6:.2f} us/record")
+
+def _count_nodes(rule):
+    count = 0
+    stack = [rule]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
+
+def benchmark_rule_memory(clause_count=10000):
+    """Memory held by a parsed rule, and interpreted evaluation of a deep rule"""
+    parser = RuleParser()
+    evaluator = RuleEvaluator()
+    rule_text = make_rule_text(clause_count)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rule = parser.parse_rule(rule_text)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    node_count = _count_nodes(rule)
+    print(f"\nRule memory ({clause_count} clauses)")
+    print(f"{node_count} nodes, {after - before} bytes, {(after - before) / node_count:.0f} bytes/node")
+
+    # Alternating AND/OR can't be flattened, so this tree is as deep as it
+    # has clauses - far past the recursion limit
+    chain = RuleNode("operand", "age > 18")
+    for i in range(clause_count):
+        chain = RuleNode("operator", "AND" if i % 2 else "OR", [chain, RuleNode("operand", "salary > 1000")])
+    users = make_users(100)
+    _, per_record = _time_per_record(lambda u: evaluator.evaluate_rule(chain, u), users)
+    print(f"Nested depth {clause_count}: evaluate_rule {per_record * 1000:.2f} ms/record")
+
+def benchmark_vectorized(row_count=1000000, scalar_rows=100000):
+    """Rows/sec of columnar evaluation vs compiled per-record evaluation"""
+    parser = RuleParser()
+    compiler = RuleCompiler()
+    vectorized = VectorizedEvaluator()
+    batch = make_user_columns(row_count)
+
+    # The scalar side runs on a prefix of the same rows as dicts
+    fields = list(batch.columns)
+    columns = [batch.columns[field][:scalar_rows].tolist() for field in fields]
+    users = [dict(zip(fields, row)) for row in zip(*columns)]
+
+    rules = [
+        ("Simple AND rule", "age > 30 AND department = 'Sales'"),
+        ("Complex rule", "(age > 25 AND salary >= 50000) OR department = 'Marketing'"),
+        ("Long AND chain", "age > 20 AND salary > 40000 AND experience >= 2 AND department != 'HR' AND age < 60")
+    ]
+
+    print(f"\nVectorized evaluation ({row_count} rows)")
+    for rule_name, rule_text in rules:
+        rule = parser.parse_rule(rule_text)
+        prepared = vectorized.compile_rule(rule)
+
+        start = time.perf_counter()
+        mask = vectorized.evaluate(prepared, batch)
+        elapsed = time.perf_counter() - start
+
+        expected, per_record = _time_per_record(compiler.compile_rule(rule).evaluate, users)
+        assert mask[:scalar_rows].tolist() == expected, f"vectorized rule disagrees with evaluator: {rule_text}"
+
+        print(f"{rule_name}: vectorized {row_count / elapsed:,.0f} rows/sec, "
+              f"compiled {1 / per_record:,.0f} rows/sec, {int(mask.sum())} matches")
+
+def benchmark_rule_network(rule_count=5000, record_count=1000):
+    """Match one record against every rule: shared predicates vs one rule at a time"""
+    parser = RuleParser()
+    compiler = RuleCompiler()
+    rules = make_rule_catalog(rule_count)
+    users = make_users(record_count)
+
+    network = RuleNetwork()
+    start = time.perf_counter()
+    network.sync(rules)
+    build = time.perf_counter() - start
+
+    compiled = [(rule['name'], compiler.compile_rule(parser.parse_rule(rule['rule_text']))) for rule in rules]
+    def match_each(user):
+        matches = []
+        for name, rule in compiled:
+            try:
+                if rule.evaluate(user):
+                    matches.append(name)
+            except TypeError:
+                pass
+        return matches
+
+    expected, per_rule_loop = _time_per_record(match_each, users)
+    actual, per_network = _time_per_record(network.match, users)
+    assert actual == expected, "rule network disagrees with compiled rules"
+
+    stats = network.stats()
+    print(f"\nAll-rules match ({rule_count} rules, {stats['predicates']} distinct predicates, "
+          f"{stats['predicate_references']} references)")
+    print(f"Network built in {build * 1000:.0f} ms")
+    print(f"One rule at a time: {per_rule_loop * 1000:.2f} ms/record, "
+          f"network: {per_network * 1000:.2f} ms/record, speedup {per_rule_loop / per_network:.1f}x")
+
+def _run_threads(thread_count, worker):
+    """Run worker(thread_index) on several threads and return the elapsed time"""
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(thread_count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+def benchmark_database(thread_counts=(1, 4, 8), ops_per_thread=2000, rule_count=1000):
+    """get_rule/save_rule ops/sec under concurrency, pooled vs connect-per-call"""
+    rules = make_rule_catalog(rule_count)
+    print(f"\nRuleDatabase under concurrency ({ops_per_thread} ops per thread, 1 in 10 is a save)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = RuleDatabase(os.path.join(tmp, 'bench.db'))
+        for rule in rules:
+            db.save_rule(rule['name'], rule['rule_text'], 'benchmark')
+
+        def connect_per_call_get(name):
+            with sqlite3.connect(db.db_name) as conn:
+                return conn.execute('SELECT * FROM rules WHERE name = ?', (name,)).fetchone()
+
+        for thread_count in thread_counts:
+            for label, get in (("pooled", db.get_rule), ("connect per call", connect_per_call_get)):
+                def worker(index):
+                    rng = random.Random(index)
+                    for i in range(ops_per_thread):
+                        rule = rules[rng.randrange(rule_count)]
+                        if i % 10 == 0:
+                            db.save_rule(rule['name'], rule['rule_text'], 'benchmark')
+                        else:
+                            get(rule['name'])
+
+                elapsed = _run_threads(thread_count, worker)
+                print(f"{thread_count} threads, {label} reads: {thread_count * ops_per_thread / elapsed:,.0f} ops/sec")
+        db.close()
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def benchmark_async_database(rule_count=2000, reads=1000, interval=0.0005):
+    """Read latency while a bulk write runs, with blocking vs awaited database calls"""
+    rules = make_rule_catalog(rule_count)
+    print(f"\nRead latency during a bulk write of {rule_count} rules")
+
+    async def run(db, blocking):
+        async def bulk_write():
+            await asyncio.sleep(interval * reads / 4)
+            for rule in rules:
+                if blocking:
+                    db.save_rule(rule['name'], rule['rule_text'], 'bulk')
+                else:
+                    await db.save_rule_async(rule['name'], rule['rule_text'], 'bulk')
+
+        async def read(name, scheduled):
+            if blocking:
+                db.get_rule(name)
+            else:
+                await db.get_rule_async(name)
+            # Measured from when the request should have started, so time
+            # spent waiting for a blocked event loop counts
+            return time.perf_counter() - scheduled
+
+        # Reads arrive at a fixed rate whether or not earlier ones finished
+        rng = random.Random(1)
+        writer = asyncio.create_task(bulk_write())
+        tasks = []
+        start = time.perf_counter()
+        for i in range(reads):
+            scheduled = start + i * interval
+            await asyncio.sleep(max(0, scheduled - time.perf_counter()))
+            tasks.append(asyncio.create_task(read(rules[rng.randrange(rule_count)]['name'], scheduled)))
+        latencies = await asyncio.gather(*tasks)
+        await writer
+        return latencies
+
+    for label, blocking in (("blocking calls", True), ("async interface", False)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = RuleDatabase(os.path.join(tmp, 'bench.db'))
+            latencies = asyncio.run(run(db, blocking))
+            db.close()
+        print(f"{label}: p50 {_percentile(latencies, 0.5) * 1000:.2f} ms, "
+              f"p99 {_percentile(latencies, 0.99) * 1000:.2f} ms")
+
+def benchmark_startup(rule_count=50000):
+    """Time to load every stored rule from rule_text vs from serialized blobs"""
+    parser = RuleParser()
+    serializer = RuleSerializer()
+    loader = RuleLoader(parser, serializer)
+    rules = make_rule_catalog(rule_count)
+    print(f"\nStartup with {rule_count} stored rules")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = RuleDatabase(os.path.join(tmp, 'bench.db'))
+        for rule in rules:
+            db.save_rule(rule['name'], rule['rule_text'], 'benchmark')
+
+        # First start after an upgrade: no blobs yet, so they are generated
+        start = time.perf_counter()
+        rows = loader.load_rows(db)
+        trees = [loader.load(rule) for rule in rows]
+        upgrade = time.perf_counter() - start
+
+        start = time.perf_counter()
+        trees = [parser.parse_rule(rule['rule_text']) for rule in db.get_all_rules()]
+        from_text = time.perf_counter() - start
+
+        start = time.perf_counter()
+        trees = [loader.load(rule) for rule in loader.load_rows(db)]
+        from_blob = time.perf_counter() - start
+        assert len(trees) == rule_count
+        db.close()
+
+    print(f"Parse rule_text: {from_text * 1000:.0f} ms, load blobs: {from_blob * 1000:.0f} ms, "
+          f"speedup {from_text / from_blob:.1f}x")
+    print(f"First start regenerating format {FORMAT_VERSION} blobs: {upgrade * 1000:.0f} ms")
+
+def benchmark_batch_file(record_count=200000, rule_count=20, worker_counts=(1, 2, 4, 8)):
+    """
+    rule_batch.evaluate_file throughput as worker processes are added, and
+    on CSV input once the numeric fields are typed
+    """
+    rules = make_rule_catalog(rule_count)
+    print(f"\nOffline batch evaluation ({record_count} JSONL records, {rule_count} rules, {os.cpu_count()} CPUs)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = RuleDatabase(os.path.join(tmp, 'bench.db'))
+        for rule in rules:
+            db.save_rule(rule['name'], rule['rule_text'], 'benchmark')
+        db.close()
+
+        input_path = os.path.join(tmp, 'users.jsonl')
+        with open(input_path, 'w') as f:
+            for user in make_users(record_count):
+                f.write(json.dumps(user) + '\n')
+
+        baseline = None
+        for workers in worker_counts:
+            stats = evaluate_file(db.db_name, input_path, os.path.join(tmp, 'results.csv'),
+                                  workers=workers, chunk_bytes=1024 * 1024)
+            baseline = baseline or stats['records_per_second']
+            print(f"{workers} workers: {stats['records_per_second']:,.0f} records/sec, "
+                  f"{stats['records_per_second'] / baseline:.2f}x")
+        with open(os.path.join(tmp, 'results.csv')) as f:
+            untyped = f.read()
+
+        # The same records as CSV, where every cell is text, with the
+        # numeric fields declared int: the results must not change
+        csv_path = os.path.join(tmp, 'users.csv')
+        users = make_users(record_count)
+        with open(csv_path, 'w') as f:
+            f.write(','.join(users[0]) + '\n')
+            for user in users:
+                f.write(','.join(str(value) for value in user.values()) + '\n')
+        db = RuleDatabase(db.db_name)
+        for field in ('age', 'salary', 'experience'):
+            db.set_attribute_type(field, 'int')
+        db.close()
+        stats = evaluate_file(db.db_name, csv_path, os.path.join(tmp, 'results.csv'),
+                              workers=worker_counts[0], chunk_bytes=1024 * 1024)
+        with open(os.path.join(tmp, 'results.csv')) as f:
+            assert f.read() == untyped, "typed CSV results differ from untyped JSONL results"
+        print(f"typed CSV, {worker_counts[0]} workers: {stats['records_per_second']:,.0f} records/sec")
+
+        # Quoted newlines in a CSV, with chunks small enough that some are
+        # cut near one: still one result row per record, in order
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(list(users[0]) + ['note'])
+            for i, user in enumerate(users[:1000]):
+                writer.writerow(list(user.values()) + ['line 1\nline "2"' if i % 3 else ''])
+        stats = evaluate_file(db.db_name, csv_path, os.path.join(tmp, 'results.csv'),
+                              workers=worker_counts[0], chunk_bytes=256)
+        with open(os.path.join(tmp, 'results.csv')) as f:
+            rows = f.read().split('\n')
+        assert stats['records'] == len(rows) - 2 == 1000, "CSV result rows don't match the input records"
+        assert rows[1:-1] == untyped.split('\n')[1:1001], "CSV results with quoted newlines moved rows"
+
+def benchmark_sql_pushdown(row_count=1000000):
+    """Matching users found in SQLite vs fetched into Python and evaluated"""
+    parser = RuleParser()
+    evaluator = RuleEvaluator()
+    compiler = RuleCompiler()
+    batch = make_user_columns(row_count)
+    fields = list(batch.columns)
+    rows = zip(range(1, row_count + 1), *(batch.columns[field].tolist() for field in fields))
+
+    rules = [
+        ("Selective AND rule", "age > 60 AND department = 'HR'"),
+        ("Selective OR rule", "salary >= 119000 OR experience > 39"),
+        ("Broad rule", "(age > 25 AND salary >= 50000) OR department = 'Marketing'")
+    ]
+
+    print(f"\nSQL pushdown ({row_count} rows)")
+    with tempfile.TemporaryDirectory() as tmp:
+        query = RuleQuery(os.path.join(tmp, 'users.db'))
+        with query.conn:
+            query.conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, age INTEGER, department TEXT, '
+                               'salary INTEGER, experience INTEGER)')
+            query.conn.executemany('INSERT INTO users VALUES (?, ?, ?, ?, ?)', rows)
+        select = f"SELECT {', '.join(fields)} FROM users"
+
+        for rule_name, rule_text in rules:
+            rule = parser.parse_rule(rule_text)
+            compiled = compiler.compile_rule(rule)
+
+            start = time.perf_counter()
+            interpreted = sum(1 for row in query.conn.execute(select)
+                              if evaluator.evaluate_rule(rule, dict(zip(fields, row))))
+            interpreted_elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            python_matches = sum(1 for row in query.conn.execute(select) if compiled.evaluate(dict(zip(fields, row))))
+            python_elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            scan_matches = len(query.find_matching(rule, 'id'))
+            scan_elapsed = time.perf_counter() - start
+
+            statements = query.create_indexes(rule)
+            start = time.perf_counter()
+            indexed_matches = len(query.find_matching(rule, 'id'))
+            indexed_elapsed = time.perf_counter() - start
+            with query.conn:
+                for statement in statements:
+                    query.conn.execute('DROP INDEX ' + statement.split()[5])
+
+            assert interpreted == python_matches == scan_matches == indexed_matches, \
+                f"SQL translation disagrees with evaluator: {rule_text}"
+            print(f"{rule_name}: evaluate_rule loop {interpreted_elapsed:.2f}s, compiled loop {python_elapsed:.2f}s, "
+                  f"SQL scan {scan_elapsed:.3f}s, SQL with {len(statements)} indexes {indexed_elapsed:.3f}s, "
+                  f"{scan_matches} matches")
+        query.close()
+
+def benchmark_result_cache(request_count=50000, profile_count=500, clause_count=200, extra_fields=30):
+    """Per-request cost with and without the result cache on repetitive profiles"""
+    rng = random.Random(42)
+    compiler = RuleCompiler()
+    # An OR of rarely matching pairs, so most conditions run on every request
+    rule = RuleParser().parse_rule(' OR '.join(
+        f"(age = {rng.randint(18, 65)} AND salary > {rng.randint(110000, 120000)})"
+        for _ in range(clause_count // 2)))
+    compiled = compiler.compile_rule(rule)
+    profiles = make_users(profile_count)
+
+    # Each request repeats a known profile plus attributes the rule ignores
+    requests = []
+    for i in range(request_count):
+        user = {key: value for key, value in rng.choice(profiles).items() if key != 'name'}
+        user.update((f'attr{n}', rng.randint(0, 1000000)) for n in range(extra_fields))
+        requests.append(user)
+
+    print(f"\nResult cache ({request_count} requests, {profile_count} distinct profiles, "
+          f"{clause_count} conditions, {extra_fields} unused fields per request)")
+    expected, uncached = _time_per_record(compiled.evaluate, requests)
+    cache = ResultCache(maxsize=profile_count * 2)
+    actual, cached = _time_per_record(lambda user: cache.evaluate('bench', (1, 1), compiled, user), requests)
+    assert actual == expected, "cached results disagree with evaluation"
+    print(f"uncached {uncached * 1e6:.2f} us/request, cached {cached * 1e6:.2f} us/request, "
+          f"hit rate {cache.stats()['hit_rate']:.1%}")
+
+def make_redundant_rule_text(clause_count, seed=42):
+    """Generate a rule with the overlapping bounds and repeated clauses UI-authored rules tend to have"""
+    rng = random.Random(seed)
+    numeric = [('age', 18, 65), ('salary', 30000, 120000), ('experience', 0, 40)]
+
+    def condition():
+        if rng.random() < 0.2:
+            return f"department {rng.choice(['=', '!='])} '{rng.choice(DEPARTMENTS)}'"
+        field, low, high = rng.choice(numeric)
+        return f"{field} {rng.choice(['>', '>=', '<', '<=', '='])} {rng.randint(low, high)}"
+
+    groups = []
+    for _ in range(clause_count // 3):
+        if rng.random() < 0.5:
+            groups.append(condition())
+        else:
+            groups.append('(' + ' OR '.join(condition() for _ in range(rng.randint(2, 4))) + ')')
+    return ' AND '.join(groups)
+
+def benchmark_optimizer(rule_count=200, clause_count=60, record_count=2000):
+    """
+    Nodes removed by RuleOptimizer and the evaluation time saved, checking
+    on seeded random rules and records that results don't change
+    """
+    parser = RuleParser()
+    evaluator = RuleEvaluator()
+    compiler = RuleCompiler()
+    optimizer = RuleOptimizer()
+    rng = random.Random(42)
+    users = make_users(record_count)
+    # Digit strings and missing fields exercise the evaluator's coercions
+    for user in users:
+        field = rng.choice(['age', 'salary', 'experience', 'department'])
+        if rng.random() < 0.2:
+            del user[field]
+        elif rng.random() < 0.2 and field != 'department':
+            user[field] = str(user[field])
+
+    print(f"\nRule optimizer ({rule_count} rules of about {clause_count} conditions, {record_count} records)")
+    before_nodes = after_nodes = 0
+    before_time = after_time = 0.0
+    for i in range(rule_count):
+        rule = parser.parse_rule(make_redundant_rule_text(clause_count, seed=i))
+        optimized, eliminated = optimizer.optimize(rule)
+        before_nodes += _count_nodes(rule)
+        after_nodes += _count_nodes(rule) - eliminated
+
+        for user in users:
+            try:
+                expected = evaluator.evaluate_rule(rule, user)
+            except TypeError:
+                continue
+            assert evaluator.evaluate_rule(optimized, user) == expected, \
+                f"optimized rule disagrees with the original: {make_redundant_rule_text(clause_count, seed=i)}"
+
+        expected, per_record = _time_per_record(compiler.compile_rule(rule).evaluate, users)
+        actual, optimized_per_record = _time_per_record(compiler.compile_rule(optimized).evaluate, users)
+        assert actual == expected
+        before_time += per_record
+        after_time += optimized_per_record
+
+    print(f"{before_nodes} nodes -> {after_nodes} nodes ({1 - after_nodes / before_nodes:.1%} eliminated), "
+          f"compiled {before_time / rule_count * 1e6:.2f} -> {after_time / rule_count * 1e6:.2f} us/record")
+
+def _predicates_per_record(rule, users):
+    stats = {}
+    predicate = ProfilingCompiler(stats).compile_rule(rule).predicate
+    for user in users:
+        predicate(user)
+    return sum(entry[0] for entry in stats.values()) / len(users)
+
+def benchmark_adaptive_order(record_count=50000):
+    """Conditions evaluated per record in written order vs after AdaptiveRule reorders"""
+    parser = RuleParser()
+    compiler = RuleCompiler()
+    users = make_users(record_count)
+    warmup, measured = users[:record_count // 2], users[record_count // 2:]
+
+    # Written in the order people tend to write them: broad conditions first
+    rules = [
+        ("Selective last", "salary >= 31000 AND experience >= 1 AND age >= 19 AND department = 'HR' AND age > 60"),
+        ("Likely last", "salary > 119000 OR age < 19 OR experience > 39 OR department != 'HR'"),
+        ("Mixed", "(age > 20 AND salary > 35000 AND department = 'Sales') OR "
+                  "(experience >= 0 AND department != 'Marketing' AND age > 62)")
+    ]
+
+    print(f"\nAdaptive condition order ({record_count // 2} records after {record_count // 2} warm-up)")
+    for rule_name, rule_text in rules:
+        rule = parser.parse_rule(rule_text)
+        adaptive = AdaptiveRule(rule)
+        for user in warmup:
+            adaptive.evaluate(user)
+
+        before = _predicates_per_record(rule, measured)
+        after = _predicates_per_record(adaptive.plan, measured)
+        expected, static_time = _time_per_record(compiler.compile_rule(rule).evaluate, measured)
+        actual, adaptive_time = _time_per_record(adaptive.evaluate, measured)
+        assert actual == expected, f"reordered rule disagrees with the original: {rule_text}"
+        print(f"{rule_name}: {before:.2f} -> {after:.2f} conditions/record, "
+              f"{static_time * 1e6:.2f} -> {adaptive_time * 1e6:.2f} us/record "
+              f"({adaptive.reorders} reorders), plan: {rule_to_text(adaptive.plan)}")
+
+def benchmark_incremental(rule_count=2000, user_count=1000, update_count=10000, extra_fields=100):
+    """Updates/sec when re-running only the rules that read a changed field vs every rule"""
+    rng = random.Random(42)
+    network = RuleNetwork()
+    network.sync(make_rule_catalog(rule_count, condition_count=2000, extra_fields=extra_fields))
+    users = make_users(user_count)
+    for user in users:
+        user.update((f'attr{n}', rng.randint(0, 100)) for n in range(extra_fields))
+    fields = [field for field in users[0] if field not in ('name', 'department')]
+
+    updates = []
+    for _ in range(update_count):
+        field = rng.choice(fields)
+        updates.append((rng.randrange(user_count), field, rng.randint(0, 100) if field.startswith('attr')
+                        else rng.randint(0, 120000) if field == 'salary' else rng.randint(0, 65)))
+
+    print(f"\nIncremental re-evaluation ({rule_count} rules over {len(fields) + 1} fields, {update_count} updates)")
+    for incremental in (False, True):
+        records = [dict(user) for user in users]
+        matched = [set(network.match(record)) for record in records]
+        start = time.perf_counter()
+        for index, field, value in updates:
+            record = records[index]
+            record[field] = value
+            if incremental:
+                for name, matches in network.evaluate_changes(record, (field,), matched[index]).items():
+                    if matches:
+                        matched[index].add(name)
+                    else:
+                        matched[index].discard(name)
+            else:
+                matched[index] = set(network.match(record))
+        elapsed = time.perf_counter() - start
+        if incremental:
+            assert matched == [set(network.match(record)) for record in records], \
+                "incremental results disagree with a full match"
+        print(f"{'Changed rules only' if incremental else 'Every rule'}: {update_count / elapsed:,.0f} updates/sec")
+
+def _load_test(evaluate, users, clients, duration):
+    """Run clients concurrent callers of evaluate for duration seconds; returns (requests/sec, latencies)"""
+    latencies = []
+
+    async def client(offset):
+        deadline = time.perf_counter() + duration
+        i = offset
+        while time.perf_counter() < deadline:
+            user = users[i % len(users)]
+            i += clients
+            start = time.perf_counter()
+            # Every request gives the loop a turn, as reading it from a socket would
+            await asyncio.sleep(0)
+            await evaluate(user)
+            latencies.append(time.perf_counter() - start)
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*(client(n) for n in range(clients)))
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run())
+    return len(latencies) / elapsed, latencies
+
+def benchmark_micro_batching(client_counts=(1, 16, 64, 256), duration=2.0, clause_count=200):
+    """Throughput and latency of /api/rules/test/-style calls with and without micro-batching"""
+    rng = random.Random(42)
+    compiler = RuleCompiler()
+    # Most conditions run on every record, as in a large eligibility rule
+    rule = RuleParser().parse_rule(' OR '.join(
+        f"(age = {rng.randint(18, 65)} AND salary > {rng.randint(110000, 120000)})"
+        for _ in range(clause_count // 2)))
+    compiled = compiler.compile_rule(rule)
+    users = make_users(5000)
+
+    async def direct(user):
+        return compiled.evaluate(user)
+
+    print(f"\nMicro-batching ({duration:g}s per run, {clause_count} conditions)")
+    print("clients  mode                 requests/sec  p50 ms  p99 ms  avg batch")
+    for clients in client_counts:
+        modes = [("direct", direct, None)]
+        for max_delay, max_batch_size in ((0.0005, 16), (0.002, 64), (0.005, 256)):
+            batcher = MicroBatcher(max_delay=max_delay, max_batch_size=max_batch_size)
+            evaluate = lambda user, batcher=batcher: batcher.evaluate('bench', (1, 1), compiled, user)
+            modes.append((f"batch {max_delay * 1000:g}ms/{max_batch_size}", evaluate, batcher))
+
+        for mode, evaluate, batcher in modes:
+            throughput, latencies = _load_test(evaluate, users, clients, duration)
+            latencies.sort()
+            average = f"{batcher.stats()['average_batch_size']:.1f}" if batcher else "-"
+            print(f"{clients:>7}  {mode:<19}  {throughput:>12,.0f}  {_percentile(latencies, 0.5) * 1000:>6.2f}  "
+                  f"{_percentile(latencies, 0.99) * 1000:>6.2f}  {average:>9}")
+
+def benchmark_typed_schema(record_count=50000):
+    """Compare compiled rules without and with an attribute schema per record"""
+    parser = RuleParser()
+    untyped = RuleCompiler()
+    typed = RuleCompiler({'age': 'int', 'salary': 'int', 'experience': 'int', 'department': 'str'})
+    users = make_users(record_count)
+
+    rules = [
+        ("Simple AND rule", "age > 30 AND department = 'Sales'"),
+        ("Numeric equality", "age = 40 OR experience = 10 OR salary = 50000"),
+        ("Long AND chain", "age > 20 AND salary > 40000 AND experience >= 2 AND department != 'HR' AND age < 60"),
+        ("Generated rule", make_rule_text(50))
+    ]
+
+    print(f"\nUntyped vs schema-typed compiled evaluation ({record_count} records)")
+    for rule_name, rule_text in rules:
+        rule = parser.parse_rule(rule_text)
+        expected, plain = _time_per_record(untyped.compile_rule(rule).evaluate, users)
+        actual, fast = _time_per_record(typed.compile_rule(rule).evaluate, users)
+        assert actual == expected, f"typed rule disagrees with untyped rule: {rule_text}"
+        print(f"{rule_name}: untyped {plain * 1e6:.2f} us/record, "
+              f"typed {fast * 1e6:.2f} us/record, speedup {plain / fast:.1f}x")
+
+def benchmark_instrumentation(calls=200000, rule_count=1000, duration=2.0):
+    """Cost of the /metrics instrumentation per request, of rendering /metrics and of the sampling profiler"""
+    metrics = RuleMetrics()
+    names = [f'rule{i}' for i in range(rule_count)]
+    clock = time.perf_counter
+
+    def bare(i):
+        return names[i % rule_count]
+
+    # What test_rule adds per request: four clock reads, three stage
+    # timings and one rule observation
+    def instrumented(i):
+        start = clock()
+        name = names[i % rule_count]
+        looked_up = clock()
+        compiled_at = clock()
+        done = clock()
+        metrics.observe_stage('lookup', looked_up - start)
+        metrics.observe_stage('compile', compiled_at - looked_up)
+        metrics.observe_stage('evaluate', done - compiled_at)
+        metrics.observe_rule(name, done - compiled_at, i & 1)
+        return name
+
+    print(f"\nInstrumentation overhead ({calls} requests over {rule_count} rules)")
+    start = clock()
+    for i in range(calls):
+        bare(i)
+    baseline = clock() - start
+    start = clock()
+    for i in range(calls):
+        instrumented(i)
+    cost = (clock() - start - baseline) / calls
+    print(f"instrumentation: {cost * 1e6:.2f} us per request")
+
+    start = clock()
+    text = render_prometheus(metrics.families())
+    print(f"/metrics render: {(clock() - start) * 1000:.1f} ms for {text.count(chr(10)):,} lines")
+
+    # Evaluation throughput on this thread with and without the profiler
+    # sampling it from another thread every 5 ms; runs alternate so drift
+    # in machine speed affects both
+    compiled = RuleCompiler().compile_rule(RuleParser().parse_rule(make_rule_text(50)))
+    users = make_users(500)
+    profiler = SamplingProfiler(threading.get_ident())
+
+    def evaluations_per_sec():
+        count = 0
+        deadline = clock() + duration
+        while clock() < deadline:
+            for user in users:
+                compiled.evaluate(user)
+            count += len(users)
+        return count / duration
+
+    plain, profiled, samples = [], [], 0
+    for _ in range(3):
+        plain.append(evaluations_per_sec())
+        results = {}
+        sampler = threading.Thread(target=lambda: results.update(profile=profiler.profile(duration, 0.005)))
+        sampler.start()
+        profiled.append(evaluations_per_sec())
+        sampler.join()
+        samples += results['profile'][1]
+    plain, profiled = sorted(plain)[1], sorted(profiled)[1]
+    change = (profiled / plain - 1) * 100
+    print(f"evaluation: {plain:,.0f}/sec, {profiled:,.0f}/sec while profiling "
+          f"({samples} samples, {abs(change):.1f}% {'faster' if change > 0 else 'slower'})")
+
+def benchmark_bulk_import(rule_count=10000, worker_counts=(1, 2, 4), page_size=100):
+    """Importing rules one create_rule at a time vs one NDJSON import, and the listing page vs the full catalog"""
+    rules = make_rule_catalog(rule_count)
+    print(f"\nImporting {rule_count} rules")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # What create_rule does per rule: validate, save, refresh the registry
+        db = RuleDatabase(os.path.join(tmp, 'single.db'))
+        registry = RuleRegistry(db)
+        registry.load([], db.get_revision())
+        start = time.perf_counter()
+        for rule in rules:
+            (row, error), = validate_rules([(rule['name'], 'benchmark', rule['rule_text'])])
+            db.save_rule(*row)
+            registry.refresh()
+        single = time.perf_counter() - start
+        db.close()
+        print(f"create_rule per rule: {single:.2f} s ({rule_count / single:,.0f} rules/sec)")
+
+        body = b''.join(chunk.encode() for chunk in export_ndjson(registry.get_all_rules()))
+        for workers in worker_counts:
+            db = RuleDatabase(os.path.join(tmp, f'bulk{workers}.db'))
+            registry = RuleRegistry(db)
+            registry.load([], db.get_revision())
+            importer = RuleImporter(workers)
+            start = time.perf_counter()
+            entries, errors = read_ndjson_rules(body)
+            results = importer.validate([rule for _, rule in entries])
+            db.save_rules([row for row, _ in results])
+            registry.refresh()
+            bulk = time.perf_counter() - start
+            importer.close()
+            assert not errors and len(registry.get_all_rules()) == rule_count
+            print(f"NDJSON import, {workers} workers: {bulk:.2f} s ({rule_count / bulk:,.0f} rules/sec, "
+                  f"{single / bulk:.1f}x faster)")
+
+        start = time.perf_counter()
+        full = json.dumps(registry.get_all_rules())
+        full_time = time.perf_counter() - start
+        start = time.perf_counter()
+        page = json.dumps(registry.get_rules_page(rule_count // 2, page_size)[0])
+        page_time = time.perf_counter() - start
+        db.close()
+    print(f"GET /api/rules/ body: full catalog {len(full) / 1024:,.0f} KiB in {full_time * 1000:.1f} ms, "
+          f"one page of {page_size} {len(page) / 1024:,.0f} KiB in {page_time * 1000:.2f} ms")
+
+def benchmark_cost_model(rule_count=200, size=200, depth=4, record_count=500):
+    """How close estimated rule costs come to measured ones, and what budget checks cost per evaluation"""
+    parser = RuleParser()
+    compiler = RuleCompiler()
+    model = CostModel()
+    model.calibrate()
+    rules = [parser.parse_rule(text) for text in make_rule_set(rule_count, size, depth)]
+    records = make_records(record_count)
+    print(f"\nCost model over {rule_count} rules of {size} conditions, depth {depth}")
+
+    start = time.perf_counter()
+    costs = [model.estimate(rule) for rule in rules]
+    estimate_time = (time.perf_counter() - start) / rule_count
+    print(f"estimate: {estimate_time * 1e6:.0f} us per rule")
+
+    # The estimate is the worst case, every condition run, so it is
+    # compared with the time to run each of the rule's conditions in turn
+    ratios = []
+    for rule, cost in zip(rules[:20], costs):
+        predicates = [compiler.compile_rule(node).predicate for node in _walk(rule) if node.type == "operand"]
+        start = time.perf_counter()
+        for record in records:
+            for predicate in predicates:
+                predicate(record)
+        measured = (time.perf_counter() - start) / record_count
+        ratios.append(measured / cost.seconds)
+    ratios.sort()
+    print(f"measured / estimated worst case: median {ratios[len(ratios) // 2]:.2f}, "
+          f"range {ratios[0]:.2f}-{ratios[-1]:.2f}")
+
+    # An OR of every condition over records missing every field runs them all
+    leaves = [node for node in _walk(rules[0]) if node.type == "operand"]
+    rule = RuleNode("operator", "OR", leaves)
+    empty = [{} for _ in range(record_count)]
+    plain = compiler.compile_rule(rule)
+    budgeted = EvaluationBudget(max_steps=10 * size, timeout=1.0).compile_rule(rule)
+    for name, compiled in (('plain', plain), ('budget-checked', budgeted)):
+        start = time.perf_counter()
+        for record in empty:
+            compiled.evaluate(record)
+        elapsed = (time.perf_counter() - start) / record_count
+        print(f"{name}: {elapsed * 1e6:.1f} us per evaluation running all {len(leaves)} conditions")
+
+    # A batch big enough to vectorize must abort where single calls do
+    budgeted = EvaluationBudget(max_steps=len(leaves) // 2).compile_rule(rule)
+    batcher = MicroBatcher(max_batch_size=64)
+
+    async def batch():
+        return await asyncio.gather(*(batcher.evaluate('bench', (1, 1), budgeted, record) for record in empty[:40]),
+                                    return_exceptions=True)
+
+    for result in asyncio.run(batch()):
+        assert isinstance(result, BudgetExceeded), "a batched evaluation skipped the budget"
+
+def _walk(rule):
+    stack = [rule]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.children)
+
+if __name__ == "__main__":
+    benchmark_compiled_evaluation()
+    benchmark_parser()
+    benchmark_rule_memory()
+    benchmark_vectorized()
+    benchmark_rule_network()
+    benchmark_database()
+    benchmark_async_database()
+    benchmark_startup()
+    benchmark_batch_file()
+    benchmark_sql_pushdown()
+    benchmark_result_cache()
+    benchmark_optimizer()
+    benchmark_adaptive_order()
+    benchmark_incremental()
+    benchmark_micro_batching()
+    benchmark_typed_schema()
+    benchmark_instrumentation()
+    benchmark_bulk_import()
+    benchmark_cost_model()
@@ -0,0 +1,180 @@
+# rule_adaptive.py
+import threading
+import time
+
+from rule_engine import RuleNode
+from rule_compiler import RuleCompiler, CompiledRule
+
+class ProfilingCompiler(RuleCompiler):
+    """Compiles conditions that record their evaluations, passes and time"""
+    def __init__(self, stats, schema=None):
+        super().__init__(schema)
+        self.stats = stats    # Condition text -> [evaluations, passes, seconds]
+
+    def _compile_condition(self, condition):
+        matches = super()._compile_condition(condition)
+        stats = self.stats.setdefault(condition, [0, 0, 0.0])
+        clock = time.perf_counter
+
+        def profiled(user_data):
+            start = clock()
+            result = matches(user_data)
+            stats[2] += clock() - start
+            stats[0] += 1
+            if result:
+                stats[1] += 1
+            return result
+
+        return profiled
+
+def rule_to_text(rule_node):
+    """Write a RuleNode tree back out as rule text"""
+    if rule_node.type == "operand":
+        return rule_node.value
+    parts = []
+    for child in rule_node.children:
+        text = rule_to_text(child)
+        # OR binds looser than AND, so an OR inside an AND needs parentheses
+        if rule_node.value == 'AND' and child.type == "operator" and child.value == 'OR':
+            text = f'({text})'
+        parts.append(text)
+    return f' {rule_node.value} '.join(parts)
+
+class AdaptiveRule(CompiledRule):
+    """
+    A compiled rule that reorders its own AND/OR children from what it sees.
+
+    One evaluation in every sample_every runs an instrumented copy of the
+    plan that records each condition's pass rate and time. After every
+    reorder_every samples the tree is reordered so that AND children that
+    are cheap and most likely to fail run first, and OR children that are
+    cheap and most likely to pass run first. A condition is ranked by its
+    expected cost per decisive outcome (cost / fail rate under AND, cost /
+    pass rate under OR); subtrees by the cost and pass rate their ordered
+    children give them, assuming conditions are independent.
+
+    The new plan is compiled in full and then published with a single
+    assignment, so a concurrent evaluate() runs either the old plan or the
+    new one. Counters are halved after each reorder so the plan follows
+    changes in traffic. Results are the same as CompiledRule's; with
+    different orders a TypeError may be raised by a different condition,
+    or skipped by short-circuiting.
+    """
+    def __init__(self, ast, sample_every=64, reorder_every=256, schema=None):
+        self.schema = schema
+        self.sample_every = sample_every
+        self.reorder_every = reorder_every
+        self.reorders = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._count = 0
+        self._samples = 0
+        super().__init__(ast, None, RuleCompiler(schema).referenced_fields(ast))
+        self._publish(ast)
+
+    def _publish(self, ast):
+        predicate = RuleCompiler(self.schema).compile_rule(ast).predicate
+        profiled = ProfilingCompiler(self._stats, self.schema).compile_rule(ast).predicate
+        self._plan = (ast, predicate, profiled)
+        self.predicate = predicate
+
+    @property
+    def plan(self):
+        """The RuleNode tree currently being evaluated"""
+        return self._plan[0]
+
+    def evaluate(self, user_data):
+        self._count += 1
+        plan = self._plan
+        if self._count % self.sample_every:
+            return plan[1](user_data)
+        result = plan[2](user_data)
+        self._samples += 1
+        if self._samples >= self.reorder_every:
+            self.reorder()
+        return result
+
+    __call__ = evaluate
+
+    def match_indices(self, records):
+        evaluate = self.evaluate
+        return [i for i, record in enumerate(records) if evaluate(record)]
+
+    def reorder(self):
+        """Rebuild the plan from the statistics gathered so far and publish it"""
+        # Only one thread reorders; the others keep evaluating the old plan
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._samples = 0
+            ast, _, _ = self._reorder_node(self._plan[0], self._estimates())
+            self._publish(ast)
+            for stats in self._stats.values():
+                stats[0] //= 2
+                stats[1] //= 2
+                stats[2] /= 2
+            self.reorders += 1
+        finally:
+            self._lock.release()
+
+    def _estimates(self):
+        """Condition text -> (seconds per evaluation, pass probability)"""
+        observed = [stats for stats in self._stats.values() if stats[0]]
+        default_cost = sum(s[2] / s[0] for s in observed) / len(observed) if observed else 1.0
+        estimates = {}
+        for condition, (evaluations, passes, seconds) in self._stats.items():
+            cost = seconds / evaluations if evaluations else default_cost
+            # Smoothed so unseen outcomes keep a small probability
+            estimates[condition] = (cost, (passes + 1) / (evaluations + 2))
+        return estimates
+
+    def _reorder_node(self, node, estimates):
+        """Return (reordered node, expected cost, pass probability)"""
+        if node.type == "operand":
+            cost, probability = estimates.get(node.value, (1.0, 0.5))
+            return node, cost, probability
+        if node.type != "operator" or node.value not in ('AND', 'OR') or not node.children:
+            return node, 0.0, 0.0
+
+        children = []
+        stack = list(reversed(node.children))
+        while stack:
+            child = stack.pop()
+            if child.type == "operator" and child.value == node.value:
+                stack.extend(reversed(child.children))
+            else:
+                children.append(self._reorder_node(child, estimates))
+
+        is_and = node.value == 'AND'
+        def rank(entry):
+            _, cost, probability = entry
+            decisive = 1 - probability if is_and else probability
+            return cost / decisive if decisive > 0 else float('inf')
+        children.sort(key=rank)
+
+        # Each child only runs if every earlier one was indecisive
+        cost = 0.0
+        reach = 1.0
+        for _, child_cost, probability in children:
+            cost += reach * child_cost
+            reach *= probability if is_and else 1 - probability
+        probability = reach if is_and else 1 - reach
+
+        return RuleNode("operator", node.value, [child for child, _, _ in children]), cost, probability
+
+    def stats(self):
+        """The current plan and what has been observed about each condition"""
+        return {
+            'plan': rule_to_text(self.plan),
+            'evaluations': self._count,
+            'reorders': self.reorders,
+            'conditions': [
+                {
+                    'condition': condition,
+                    'evaluations': evaluations,
+                    'pass_rate': passes / evaluations if evaluations else None,
+                    'average_ns': seconds / evaluations * 1e9 if evaluations else None
+                }
+                for condition, (evaluations, passes, seconds) in self._stats.items()
+            ]
+        }
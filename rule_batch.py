@@ -0,0 +1,219 @@
+# rule_batch.py
+"""
+Score a CSV or JSONL extract against rules stored in rules.db.
+
+    python rule_batch.py users.jsonl results.csv --rules "Senior Sales Rule" --workers 8
+
+The input is memory-mapped and split into chunks on record boundaries.
+Chunks are evaluated by a pool of worker processes, each of which loads and
+compiles the rules once, and results are written in input order. JSONL
+records must sit on one line. CSV fields may hold newlines if they are
+quoted; a field holding a quote must be quoted too, as chunks are cut where
+the quotes before them are balanced.
+
+The output is a CSV with one column per rule and one row per input record:
+1 for a match, 0 for no match, and "error" when the record couldn't be read
+or the rule couldn't compare one of its values. CSV cells of attributes the
+schema declares a type for are converted to it; a cell that doesn't fit
+stays text, so rules reading it give "error".
+"""
+import argparse
+import csv
+import io
+import json
+import mmap
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from rule_database import RuleDatabase
+from rule_compiler import RuleCompiler
+from rule_schema import SchemaError, convert_literal
+from rule_serializer import RuleLoader
+
+# State of each worker process, filled in by _init_worker
+_worker = {}
+
+def _detect_format(path):
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+def _load_compiled_rules(db_name, rule_names):
+    """
+    Compile the named rules (all rules if None) from a rules database.
+    Returns (rule names, compiled rules, attribute schema).
+    """
+    db = RuleDatabase(db_name)
+    loader = RuleLoader()
+    try:
+        rules = {rule['name']: rule for rule in db.get_all_rules(include_ast=True)}
+        schema = db.get_schema()
+        compiler = RuleCompiler(schema)
+    finally:
+        db.close()
+
+    if rule_names is None:
+        rule_names = sorted(rules)
+    missing = [name for name in rule_names if name not in rules]
+    if missing:
+        raise ValueError(f"Rules not found: {', '.join(missing)}")
+    return rule_names, [compiler.compile_rule(loader.load(rules[name])) for name in rule_names], schema
+
+def _cell_converter(field, kind):
+    """Turn a CSV cell into the type the schema declares for its column"""
+    def convert(value):
+        try:
+            return convert_literal(field, '=', value, kind)
+        except SchemaError:
+            return value
+    return convert
+
+def _init_worker(db_name, rule_names, input_path, input_format, header):
+    _, compiled, schema = _load_compiled_rules(db_name, rule_names)
+    input_file = open(input_path, 'rb')
+    _worker['rules'] = compiled
+    # CSV cells are all text; typed columns are converted, untyped ones aren't
+    converters = [_cell_converter(field, schema[field]) if schema.get(field, 'str') != 'str' else None
+                  for field in header or ()]
+    _worker['converters'] = converters if any(converters) else None
+    _worker['data'] = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    _worker['format'] = input_format
+    _worker['header'] = header
+
+def _score(record, rules):
+    cells = []
+    for rule in rules:
+        try:
+            cells.append('1' if rule.evaluate(record) else '0')
+        except TypeError:
+            cells.append('error')
+    return ','.join(cells)
+
+def _evaluate_chunk(span):
+    """Evaluate the lines in data[start:end]; returns (output bytes, record count)"""
+    start, end = span
+    rules = _worker['rules']
+    header = _worker['header']
+    error_row = ','.join(['error'] * len(rules))
+    text = _worker['data'][start:end].decode('utf-8')
+
+    output = []
+    if _worker['format'] == 'csv':
+        converters = _worker['converters']
+        # The reader sees the line endings, so quoted newlines stay in their field
+        for row in csv.reader(io.StringIO(text, newline='')):
+            if not row:
+                continue
+            # Empty cells are treated as missing fields
+            if converters is None:
+                record = {field: value for field, value in zip(header, row) if value != ''}
+            else:
+                record = {field: convert(value) if convert else value
+                          for field, convert, value in zip(header, converters, row) if value != ''}
+            output.append(_score(record, rules))
+    else:
+        # Split on \n only; JSON strings may contain other line separators
+        for line in text.split('\n'):
+            line = line.rstrip('\r')
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                output.append(error_row)
+                continue
+            output.append(_score(record, rules) if isinstance(record, dict) else error_row)
+
+    output.append('')
+    return '\n'.join(output).encode('utf-8'), len(output) - 1
+
+def _chunk_spans(data, start, chunk_bytes, quoted=False):
+    """
+    Split data[start:] into spans of about chunk_bytes ending on a newline.
+    With quoted (CSV), a newline only ends a span when the quotes before it
+    in the span are balanced; an escaped quote ("") counts as two.
+    """
+    size = len(data)
+    while start < size:
+        end = data.find(b'\n', min(start + chunk_bytes, size))
+        if quoted and end != -1:
+            quotes = data[start:end].count(b'"')
+            while quotes % 2 and end != -1:
+                following = data.find(b'\n', end + 1)
+                quotes += data[end:size if following == -1 else following].count(b'"')
+                end = following
+        end = size if end == -1 else end + 1
+        yield start, end
+        start = end
+
+def evaluate_file(db_name, input_path, output_path, rule_names=None, workers=None,
+                  chunk_bytes=4 * 1024 * 1024, input_format=None):
+    """Evaluate every record in input_path and write results to output_path"""
+    input_format = input_format or _detect_format(input_path)
+    workers = workers or os.cpu_count() or 1
+    rule_names, _, _ = _load_compiled_rules(db_name, rule_names)
+
+    started = time.perf_counter()
+    records = 0
+    with open(input_path, 'rb') as input_file, open(output_path, 'wb') as output:
+        output.write((','.join(_csv_cell(name) for name in rule_names) + '\n').encode('utf-8'))
+        if os.fstat(input_file.fileno()).st_size == 0:
+            return {'records': 0, 'elapsed_seconds': 0.0, 'records_per_second': 0.0}
+
+        with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header = None
+            start = 0
+            quoted = input_format == 'csv'
+            if quoted:
+                _, start = next(_chunk_spans(data, 0, 0, quoted))
+                header = next(csv.reader(io.StringIO(data[:start].decode('utf-8'), newline='')))
+
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(db_name, rule_names, input_path, input_format, header)) as pool:
+                # Keep a bounded number of chunks in flight and write them
+                # back in the order they were read
+                in_flight = deque()
+                for span in _chunk_spans(data, start, chunk_bytes, quoted):
+                    in_flight.append(pool.submit(_evaluate_chunk, span))
+                    if len(in_flight) >= workers * 2:
+                        chunk, count = in_flight.popleft().result()
+                        output.write(chunk)
+                        records += count
+                while in_flight:
+                    chunk, count = in_flight.popleft().result()
+                    output.write(chunk)
+                    records += count
+
+    elapsed = time.perf_counter() - started
+    return {
+        'records': records,
+        'elapsed_seconds': elapsed,
+        'records_per_second': records / elapsed if elapsed > 0 else 0.0
+    }
+
+def _csv_cell(value):
+    if any(c in value for c in ',"\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate stored rules against a CSV or JSONL file")
+    parser.add_argument('input', help="CSV (with a header row) or JSONL file of records")
+    parser.add_argument('output', help="CSV file to write results to")
+    parser.add_argument('--db', default='rules.db', help="Rules database (default: rules.db)")
+    parser.add_argument('--rules', nargs='+', help="Rule names to evaluate (default: all rules)")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument('--chunk-mb', type=float, default=4, help="Approximate chunk size in MB (default: 4)")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="Input format (default: from file extension)")
+    args = parser.parse_args(argv)
+
+    try:
+        stats = evaluate_file(args.db, args.input, args.output, args.rules, args.workers,
+                              int(args.chunk_mb * 1024 * 1024), args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Evaluated {stats['records']} records in {stats['elapsed_seconds']:.2f}s "
+          f"({stats['records_per_second']:,.0f} records/sec)")
+
+if __name__ == "__main__":
+    main()
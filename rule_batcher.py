@@ -0,0 +1,98 @@
+# rule_batcher.py
+import asyncio
+
+from rule_vectorized import VectorizedEvaluator, ColumnBatch
+from rule_cost import BudgetedRule
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-record evaluations of the same rule.
+
+    The first request for a rule opens a batch; requests for the same rule
+    version that arrive within max_delay seconds join it, and the batch is
+    evaluated as soon as the delay expires or it holds max_batch_size
+    records. A request therefore waits at most max_delay plus the time to
+    evaluate one batch. Batches of at least vectorize_min records are
+    evaluated column-wise with VectorizedEvaluator, smaller ones record by
+    record. If the vectorized pass hits a value it can't compare, the
+    batch is evaluated record by record, so only the callers whose record
+    fails get the TypeError. A BudgetedRule is always evaluated record by
+    record, so its budget applies however many requests share a batch.
+
+    All methods must be called from the event loop thread. schema is the
+    attribute schema the rules were compiled with.
+    """
+    def __init__(self, max_delay=0.002, max_batch_size=64, vectorize_min=32, schema=None):
+        self.max_delay = max_delay
+        self.max_batch_size = max_batch_size
+        self.vectorize_min = vectorize_min
+        self.vectorized = VectorizedEvaluator(schema)
+        self._pending = {}     # (name, version) -> (compiled rule, records, futures, timer)
+        self._prepared = {}    # (name, version) -> VectorizedRule
+        self.batches = 0
+        self.records = 0
+
+    async def evaluate(self, name, version, compiled, user_data):
+        """Evaluate compiled (a CompiledRule) for user_data as part of a batch"""
+        loop = asyncio.get_running_loop()
+        key = (name, version)
+        batch = self._pending.get(key)
+        if batch is None:
+            timer = loop.call_later(self.max_delay, self._flush, key)
+            batch = (compiled, [], [], timer)
+            self._pending[key] = batch
+
+        future = loop.create_future()
+        batch[1].append(user_data)
+        batch[2].append(future)
+        if len(batch[1]) >= self.max_batch_size:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        compiled, records, futures, timer = batch
+        timer.cancel()
+        self.batches += 1
+        self.records += len(records)
+
+        if len(records) >= self.vectorize_min and not isinstance(compiled, BudgetedRule):
+            try:
+                mask = self.vectorized.evaluate(self._prepare(key, compiled), ColumnBatch.from_records(records))
+            except TypeError:
+                pass
+            else:
+                for future, result in zip(futures, mask.tolist()):
+                    if not future.done():
+                        future.set_result(result)
+                return
+
+        for future, record in zip(futures, records):
+            if future.done():
+                continue
+            try:
+                future.set_result(compiled.evaluate(record))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _prepare(self, key, compiled):
+        prepared = self._prepared.get(key)
+        if prepared is None:
+            prepared = self._prepared[key] = self.vectorized.compile_rule(compiled.ast)
+        return prepared
+
+    def invalidate(self, name):
+        """Forget the prepared form of every version of a rule"""
+        for key in [key for key in self._prepared if key[0] == name]:
+            del self._prepared[key]
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'records': self.records,
+            'average_batch_size': self.records / self.batches if self.batches else 0.0,
+            'max_delay_ms': self.max_delay * 1000,
+            'max_batch_size': self.max_batch_size
+        }
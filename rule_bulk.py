@@ -0,0 +1,147 @@
+# rule_bulk.py
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from rule_engine import RuleParser
+from rule_compiler import RuleCompiler
+from rule_optimizer import RuleOptimizer
+from rule_serializer import RuleSerializer, FORMAT_VERSION
+from rule_cost import CostModel
+
+class RuleReader:
+    """
+    Read rules from newline-delimited JSON, one {"name", "description",
+    "rule_text"} object per line.
+
+    Lines are added one at a time, or read from an async iterator of byte
+    chunks as they arrive, so the raw body is never held in full. entries
+    collects (line number, (name, description, rule_text)) and errors a
+    dict per bad line with its number and what's wrong with it.
+    """
+    def __init__(self, max_line_bytes=1024 * 1024):
+        self.max_line_bytes = max_line_bytes
+        self.entries = []
+        self.errors = []
+        self._seen = set()
+        self._number = 0
+
+    def add_line(self, line):
+        self._number += 1
+        number = self._number
+        if not line.strip():
+            return
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            self.errors.append({'line': number, 'error': f'Invalid JSON: {e}'})
+            return
+        if not isinstance(item, dict) or not isinstance(item.get('name'), str) or not isinstance(item.get('rule_text'), str):
+            self.errors.append({'line': number, 'error': 'Each line needs a "name" and a "rule_text" string'})
+            return
+        name = item['name']
+        if name in self._seen:
+            self.errors.append({'line': number, 'name': name, 'error': 'Duplicate rule name'})
+            return
+        self._seen.add(name)
+        description = item.get('description')
+        self.entries.append((number, (name, description if isinstance(description, str) else None, item['rule_text'])))
+
+    async def read_stream(self, chunks):
+        """Add every line of an async iterator of bytes; stops at a line over max_line_bytes"""
+        pending = b''
+        async for chunk in chunks:
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                self.add_line(line)
+            if len(pending) > self.max_line_bytes:
+                self.errors.append({'line': self._number + 1, 'error': f'Line longer than {self.max_line_bytes} bytes'})
+                return
+        if pending:
+            self.add_line(pending)
+
+def read_ndjson_rules(body):
+    """Read a whole NDJSON body with RuleReader; returns (entries, errors)"""
+    reader = RuleReader()
+    for line in body.split(b'\n' if isinstance(body, bytes) else '\n'):
+        reader.add_line(line)
+    return reader.entries, reader.errors
+
+def validate_rules(rules, schema=None, costs=None, limits=None):
+    """
+    Parse, schema-check, optimize and cost-check (name, description,
+    rule_text) tuples as create_rule does. costs are the CostModel's
+    condition costs and limits a CostLimits. Returns one (row, None) or
+    (None, error message) per rule, where row is ready for
+    RuleDatabase.save_rules.
+    """
+    parser = RuleParser()
+    compiler = RuleCompiler(schema)
+    optimizer = RuleOptimizer(schema)
+    serializer = RuleSerializer()
+    cost_model = CostModel(schema, costs)
+    results = []
+    for name, description, rule_text in rules:
+        try:
+            rule_ast = parser.parse_rule(rule_text)
+            compiler.check_schema(rule_ast)
+            rule_ast, _ = optimizer.optimize(rule_ast)
+            if limits is not None:
+                limits.check(cost_model.estimate(rule_ast))
+            results.append(((name, rule_text, description, serializer.dumps(rule_ast), FORMAT_VERSION), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+class RuleImporter:
+    """
+    Validate large rule imports on a pool of worker processes.
+
+    Imports of fewer than parallel_min rules are validated in the calling
+    thread, where starting workers and shipping the rules to them would
+    cost more than it saves. The pool is started on first use, from a fork
+    server (or spawned where there is none): the server runs threads, and
+    a forked child could inherit a lock one of them was holding.
+    """
+    def __init__(self, workers=None, parallel_min=500):
+        self.workers = workers or os.cpu_count() or 1
+        self.parallel_min = parallel_min
+        self._executor = None
+
+    def validate(self, rules, schema=None, costs=None, limits=None):
+        """validate_rules, split across the worker processes"""
+        rules = list(rules)
+        if self.workers == 1 or len(rules) < self.parallel_min:
+            return validate_rules(rules, schema, costs, limits)
+
+        if self._executor is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+        # A few chunks per worker so an uneven split doesn't leave one waiting
+        chunk_size = -(-len(rules) // (self.workers * 4))
+        chunks = [rules[i:i + chunk_size] for i in range(0, len(rules), chunk_size)]
+        results = []
+        count = len(chunks)
+        for part in self._executor.map(validate_rules, chunks, [schema] * count, [costs] * count, [limits] * count):
+            results.extend(part)
+        return results
+
+    async def validate_async(self, rules, schema=None, costs=None, limits=None):
+        """validate() on a thread, so the event loop keeps serving while rules are checked"""
+        return await asyncio.to_thread(self.validate, rules, schema, costs, limits)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+def export_ndjson(rules, chunk_size=1000):
+    """Yield rule rows as newline-delimited JSON that read_ndjson_rules accepts, chunk_size lines at a time"""
+    for start in range(0, len(rules), chunk_size):
+        yield ''.join(
+            json.dumps({'name': rule['name'], 'description': rule['description'], 'rule_text': rule['rule_text']}) + '\n'
+            for rule in rules[start:start + chunk_size]
+        )
@@ -0,0 +1,191 @@
+# rule_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class RuleCache:
+    """
+    In-process registry of compiled rules with bounded LRU eviction.
+
+    Entries are keyed by rule name and version (the row id and the revision
+    stamped on every write), so a rule that was changed in the database is
+    never served from a stale entry even if nobody called invalidate().
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # name -> (version, compiled)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def version_of(rule):
+        """Build the cache version for a rule row returned by RuleDatabase"""
+        return (rule['id'], rule['revision'])
+
+    def get(self, name, version):
+        """Return the cached compiled rule, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, name, version, compiled):
+        """Store a compiled rule, evicting the least recently used entries"""
+        with self._lock:
+            self._entries[name] = (version, compiled)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compile(self, rule, compile_fn):
+        """
+        Return the compiled form of a rule row, compiling it on a miss.
+        compile_fn receives the rule row and returns the compiled rule.
+        """
+        version = self.version_of(rule)
+        compiled = self.get(rule['name'], version)
+        if compiled is None:
+            compiled = compile_fn(rule)
+            self.put(rule['name'], version, compiled)
+        return compiled
+
+    def invalidate(self, name):
+        """Drop the entry for a rule that was created, updated or deleted"""
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters used to size the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+class ResultCache:
+    """
+    Bounded LRU/TTL cache of rule results.
+
+    Results are keyed on the rule name and version plus the values of only
+    the fields the compiled rule reads (CompiledRule.fields), so requests
+    that differ in attributes the rule ignores share one entry. Each value
+    is keyed with its type because 1, 1.0, True and '1' can compare
+    differently in a rule. Records with unhashable values in a referenced
+    field (lists, objects) are evaluated without caching.
+    """
+    def __init__(self, maxsize=10000, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (name, version, values, types) -> (expires_at, result)
+        self._keys_by_rule = {}        # name -> set of keys, for invalidate()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.uncacheable = 0
+
+    def evaluate(self, name, version, compiled, user_data):
+        """Return compiled.evaluate(user_data), reusing a cached result when possible"""
+        key, result = self.lookup(name, version, compiled, user_data)
+        if result is None:
+            # Evaluate outside the lock; errors are raised and not cached
+            result = compiled.evaluate(user_data)
+            self.store(key, result)
+        return result
+
+    def lookup(self, name, version, compiled, user_data):
+        """
+        Return (key, cached result), with None for the result on a miss.
+        Pass the key to store() once the result is known; the key is None
+        when user_data can't be cached.
+        """
+        get = user_data.get
+        values = tuple([get(field, _MISSING) for field in compiled.fields])
+        key = (name, version, values, tuple(map(type, values)))
+        try:
+            hash(key)
+        except TypeError:
+            with self._lock:
+                self.uncacheable += 1
+            return None, None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return key, entry[1]
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+        return key, None
+
+    def store(self, key, result):
+        """Cache the result for a key returned by lookup()"""
+        if key is None:
+            return
+        name = key[0]
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            self._keys_by_rule.setdefault(name, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        keys = self._keys_by_rule.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_rule[key[0]]
+
+    def invalidate(self, name):
+        """Drop every cached result for a rule that was updated or deleted"""
+        with self._lock:
+            for key in self._keys_by_rule.pop(name, ()):
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_rule.clear()
+
+    def stats(self):
+        """Counters used to size the cache and judge its hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'uncacheable': self.uncacheable,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,235 @@
+# rule_compiler.py
+import operator
+
+from rule_schema import SchemaError, convert_literal, typed_matcher
+
+_MISSING = object()
+
+def _always_false(user_data):
+    return False
+
+class Condition:
+    """A parsed leaf condition with its literal resolved once"""
+    __slots__ = ('field', 'operator', 'value', 'number', 'compare', 'kind', 'literal')
+
+    def __init__(self, field, operator, value, compare, kind=None):
+        self.field = field          # Name of the attribute in user_data
+        self.operator = operator    # One of > < >= <= = !=
+        self.value = value          # Literal with surrounding quotes removed
+        self.compare = compare      # Function implementing the operator
+        self.kind = kind            # Type the schema declares for field, or None
+
+        # With a declared type the literal is converted to it here and
+        # record values are compared as they are (see rule_schema)
+        self.literal = None
+        self.number = None
+        if kind is not None:
+            self.literal = convert_literal(field, operator, value, kind)
+            return
+
+        # Numeric literals are converted once; the record value is converted
+        # per call only when it is a non-negative integer like the literal
+        if value.isdigit():
+            try:
+                self.number = int(value)
+            except ValueError:
+                pass
+
+    @property
+    def key(self):
+        """Identifies conditions that always give the same result"""
+        return (self.field, self.operator, self.value, self.kind)
+
+    def value_matcher(self):
+        """
+        Build a function that tests a field value that is present in the
+        record, using the same coercion as RuleEvaluator._evaluate_condition
+        or, for a typed field, the typed comparison
+        """
+        if self.kind is not None:
+            return typed_matcher(self.field, self.kind, self.compare, self.literal)
+
+        compare = self.compare
+        value = self.value
+        number = self.number
+        # = and != compare string forms, like the evaluator does
+        stringify = self.operator in ('=', '!=')
+
+        def value_matches(actual):
+            if number is not None:
+                kind = type(actual)
+                if kind is int:
+                    if actual >= 0:
+                        return compare(actual, number)
+                else:
+                    text = actual if kind is str else str(actual)
+                    if text.isdigit():
+                        try:
+                            return compare(int(text), number)
+                        except ValueError:
+                            pass
+
+            if stringify:
+                return compare(str(actual), value)
+            return compare(actual, value)
+
+        return value_matches
+
+class CompiledRule:
+    """A RuleNode tree turned into a single callable"""
+    def __init__(self, ast, predicate, fields=()):
+        self.ast = ast                # The RuleNode tree this was compiled from
+        self.predicate = predicate    # Callable taking user_data and returning True/False
+        self.fields = fields          # Sorted names of the user_data fields the rule reads
+
+    def evaluate(self, user_data):
+        return self.predicate(user_data)
+
+    __call__ = evaluate
+
+    def match_indices(self, records):
+        """Evaluate every record and return the positions of those that match"""
+        predicate = self.predicate
+        return [i for i, record in enumerate(records) if predicate(record)]
+
+class RuleCompiler:
+    """
+    Compile a parsed RuleNode tree into nested closures.
+
+    Field names, operators and literal values are resolved once here, so
+    evaluating the result does no string splitting, quote stripping or
+    operator dispatch. Results match RuleEvaluator.evaluate_rule, which
+    stays the reference implementation, except that AND/OR short-circuit.
+
+    schema optionally maps field names to attribute types (see
+    rule_schema). Conditions on those fields get their literal converted
+    to the type and a comparator that does no coercion; a literal that
+    doesn't fit raises SchemaError. The mapping is read each time a
+    condition is parsed, so updating it in place affects later compiles.
+    """
+    def __init__(self, schema=None):
+        self.schema = schema if schema is not None else {}
+        self.comparators = {
+            '>': operator.gt,
+            '<': operator.lt,
+            '>=': operator.ge,
+            '<=': operator.le,
+            '=': operator.eq,
+            '!=': operator.ne
+        }
+
+    def compile_rule(self, rule_node):
+        """Compile a RuleNode tree into a CompiledRule"""
+        return CompiledRule(rule_node, self._compile_node(rule_node), self.referenced_fields(rule_node))
+
+    def referenced_fields(self, rule_node):
+        """Return a sorted tuple of the fields whose values can affect the result"""
+        fields = set()
+        stack = [rule_node]
+        while stack:
+            node = stack.pop()
+            if node.type == "operand":
+                parsed = self.parse_condition(node.value)
+                if parsed is not None:
+                    fields.add(parsed.field)
+            elif node.type == "operator" and node.value in ('AND', 'OR'):
+                stack.extend(node.children)
+        return tuple(sorted(fields))
+
+    def check_schema(self, rule_node):
+        """Raise SchemaError listing every condition that doesn't fit the schema"""
+        errors = []
+        stack = [rule_node]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.children)
+            if node.type == "operand":
+                try:
+                    self.parse_condition(node.value)
+                except SchemaError as e:
+                    errors.append(str(e))
+        if errors:
+            raise SchemaError('; '.join(sorted(set(errors))))
+
+    def _compile_node(self, node):
+        if node.type == "operand":
+            return self._compile_condition(node.value)
+        if node.type != "operator" or node.value not in ('AND', 'OR'):
+            return _always_false
+
+        # The parser already flattens A AND B AND C into one node; trees
+        # built by hand may still nest the same operator, so flatten here too
+        children = []
+        stack = list(reversed(node.children))
+        while stack:
+            child = stack.pop()
+            if child.type == "operator" and child.value == node.value:
+                stack.extend(reversed(child.children))
+            else:
+                children.append(self._compile_node(child))
+
+        if len(children) == 1:
+            return children[0]
+
+        if node.value == "AND":
+            return self._compile_and(children)
+        return self._compile_or(children)
+
+    def _compile_and(self, children):
+        if len(children) == 2:
+            first, second = children
+            return lambda user_data: first(user_data) and second(user_data)
+
+        children = tuple(children)
+        def all_match(user_data):
+            for child in children:
+                if not child(user_data):
+                    return False
+            return True
+        return all_match
+
+    def _compile_or(self, children):
+        if len(children) == 2:
+            first, second = children
+            return lambda user_data: first(user_data) or second(user_data)
+
+        children = tuple(children)
+        def any_match(user_data):
+            for child in children:
+                if child(user_data):
+                    return True
+            return False
+        return any_match
+
+    def parse_condition(self, condition):
+        """Split 'field operator value' once; returns None if it can never match"""
+        parts = condition.split()
+        if len(parts) != 3:
+            return None
+
+        field, op, value = parts
+        compare = self.comparators.get(op)
+        if compare is None:
+            return None
+
+        # Handle string values (remove quotes)
+        if value.startswith("'") and value.endswith("'"):
+            value = value[1:-1]
+        return Condition(field, op, value, compare, self.schema.get(field))
+
+    def _compile_condition(self, condition):
+        """Compile a single condition like 'age > 30' or "department = 'Sales'" """
+        parsed = self.parse_condition(condition)
+        if parsed is None:
+            return _always_false
+
+        field = parsed.field
+        matches = parsed.value_matcher()
+
+        def condition_matches(user_data):
+            actual = user_data.get(field, _MISSING)
+            if actual is _MISSING:
+                return False
+            return matches(actual)
+
+        return condition_matches
@@ -0,0 +1,250 @@
+# rule_cost.py
+import time
+
+from rule_engine import RuleNode
+from rule_compiler import RuleCompiler, CompiledRule
+from rule_adaptive import rule_to_text
+
+# Seconds per evaluation of each class of condition, until calibrate()
+# replaces them with what this machine actually does. A class is 'number'
+# or 'text' for an untyped condition (by its literal) or the attribute type
+# of a typed one.
+DEFAULT_COSTS = {
+    'number': 2.5e-7,
+    'text': 2e-7,
+    'int': 1.5e-7,
+    'float': 1.5e-7,
+    'str': 1.5e-7,
+    'bool': 1.5e-7,
+    'date': 1.5e-7
+}
+# Calling the children of an AND/OR, per child
+OPERATOR_COST = 5e-8
+
+# A record value of each class to time conditions against in calibrate()
+_CALIBRATION = {
+    'number': ("f > 5", {}, 7),
+    'text': ("f = 'abc'", {}, 'abd'),
+    'int': ("f > 5", {'f': 'int'}, 7),
+    'float': ("f > 5.5", {'f': 'float'}, 7.5),
+    'str': ("f = 'abc'", {'f': 'str'}, 'abd'),
+    'bool': ("f = true", {'f': 'bool'}, False),
+    'date': ("f > '2024-01-01'", {'f': 'date'}, '2024-06-30')
+}
+
+class CostLimitError(ValueError):
+    """A rule over the configured cost limits"""
+
+class BudgetExceeded(RuntimeError):
+    """An evaluation stopped because it went over its step or time budget"""
+
+class RuleCost:
+    """What a RuleNode tree costs: its size and the estimated seconds per record"""
+    __slots__ = ('nodes', 'depth', 'conditions', 'seconds')
+
+    def __init__(self, nodes, depth, conditions, seconds):
+        self.nodes = nodes              # Every operator and operand node
+        self.depth = depth              # Nodes on the longest path from the root
+        self.conditions = conditions    # Operands, the most one evaluation can run
+        self.seconds = seconds          # Worst case: every condition evaluated
+
+    def as_dict(self):
+        return {
+            'nodes': self.nodes,
+            'depth': self.depth,
+            'conditions': self.conditions,
+            'estimated_us': round(self.seconds * 1e6, 3)
+        }
+
+class CostModel:
+    """
+    Estimate what evaluating a rule costs per record, before it runs.
+
+    The estimate is the worst case, with no short-circuiting: every
+    condition's cost plus a small cost per child of each AND/OR. Condition
+    costs are kept per class (see DEFAULT_COSTS). calibrate() times
+    compiled conditions of each class on this machine. Timings vary from
+    run to run, so the app calibrates once and stores the result in the
+    database; every process then admits or rejects a rule the same way.
+    """
+    def __init__(self, schema=None, costs=None):
+        self.compiler = RuleCompiler(schema)
+        self.costs = dict(DEFAULT_COSTS, **(costs or {}))
+
+    def condition_class(self, condition):
+        """The cost class of a condition's text, or None for one that never matches"""
+        parsed = self.compiler.parse_condition(condition)
+        if parsed is None:
+            return None
+        if parsed.kind is not None:
+            return parsed.kind
+        return 'number' if parsed.number is not None else 'text'
+
+    def estimate(self, rule_node):
+        """Return the RuleCost of a RuleNode tree"""
+        nodes = depth = conditions = 0
+        seconds = 0.0
+        costs = self.costs
+        stack = [(rule_node, 1)]
+        while stack:
+            node, level = stack.pop()
+            nodes += 1
+            if level > depth:
+                depth = level
+            if node.type == "operand":
+                conditions += 1
+                seconds += costs.get(self.condition_class(node.value), 0.0)
+            else:
+                seconds += OPERATOR_COST * len(node.children)
+                stack.extend((child, level + 1) for child in node.children)
+        return RuleCost(nodes, depth, conditions, seconds)
+
+    def calibrate(self, calls=5000, repeat=3):
+        """Time a compiled condition of each class, use the results as costs and return them"""
+        clock = time.perf_counter
+        for kind, (condition, schema, value) in _CALIBRATION.items():
+            predicate = RuleCompiler(schema).compile_rule(RuleNode("operand", condition)).predicate
+            records = [{'f': value}] * calls
+            best = None
+            for _ in range(repeat):
+                start = clock()
+                for record in records:
+                    predicate(record)
+                elapsed = (clock() - start) / calls
+                best = elapsed if best is None else min(best, elapsed)
+            self.costs[kind] = best
+        return dict(self.costs)
+
+class CostLimits:
+    """
+    Ceilings a rule must stay under to be stored. A limit of 0 is no limit;
+    max_seconds is the estimated evaluation cost per record.
+    """
+    def __init__(self, max_nodes=0, max_depth=0, max_seconds=0.0):
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.max_seconds = max_seconds
+
+    def check(self, cost):
+        """Raise CostLimitError listing every limit a RuleCost is over"""
+        errors = []
+        if self.max_nodes and cost.nodes > self.max_nodes:
+            errors.append(f"{cost.nodes} nodes, over the limit of {self.max_nodes}")
+        if self.max_depth and cost.depth > self.max_depth:
+            errors.append(f"nested {cost.depth} deep, over the limit of {self.max_depth}")
+        if self.max_seconds and cost.seconds > self.max_seconds:
+            errors.append(f"estimated {cost.seconds * 1e6:.1f} us per record, "
+                          f"over the limit of {self.max_seconds * 1e6:g} us")
+        if errors:
+            raise CostLimitError("Rule is too expensive: " + '; '.join(errors))
+
+    def as_dict(self):
+        return {
+            'max_nodes': self.max_nodes,
+            'max_depth': self.max_depth,
+            'max_estimated_us': self.max_seconds * 1e6
+        }
+
+class EvaluationBudget:
+    """
+    The most one evaluation may do: max_steps conditions and timeout
+    seconds (0 for no limit).
+
+    Checking a budget costs a counter update per condition, so only rules
+    that could go over it are compiled with checks: those with more
+    conditions than max_steps, and, when there is a timeout, those
+    estimated to cost more than check_above seconds per record. The
+    estimate assumes ordinary values, so the timeout is what stops a rule
+    that is slow on the data it gets (very long strings, say). A rule is
+    checked or not from its estimate when it is compiled.
+    """
+    def __init__(self, max_steps=0, timeout=0.0, check_above=0.0, check_every=16):
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.check_above = check_above
+        self.check_every = check_every
+
+    def applies(self, cost):
+        """Whether a rule with this RuleCost needs its evaluations checked"""
+        if self.max_steps and cost.conditions > self.max_steps:
+            return True
+        return bool(self.timeout) and cost.seconds > self.check_above
+
+    def compile_rule(self, rule_node, schema=None):
+        """Compile a RuleNode tree into a BudgetedRule"""
+        return BudgetedRule(rule_node, self, schema)
+
+class BudgetedRule(CompiledRule):
+    """
+    A compiled rule whose evaluations raise BudgetExceeded once they have
+    run more than max_steps conditions or taken longer than timeout. The
+    clock is read every check_every conditions. There is one step counter
+    per rule, so evaluations of it must all run on one thread (the event
+    loop's). Its conditions keep the optimizer's order; they aren't
+    profiled or reordered like AdaptiveRule's.
+    """
+    def __init__(self, ast, budget, schema=None):
+        self.budget = budget
+        self.evaluations = 0
+        self._state = [0, None]    # Conditions run, deadline
+        compiler = _BudgetedCompiler(schema, self._state, budget)
+        super().__init__(ast, compiler.compile_rule(ast).predicate, compiler.referenced_fields(ast))
+
+    def evaluate(self, user_data):
+        self.evaluations += 1
+        state = self._state
+        state[0] = 0
+        timeout = self.budget.timeout
+        state[1] = time.perf_counter() + timeout if timeout else None
+        return self.predicate(user_data)
+
+    __call__ = evaluate
+
+    def match_indices(self, records):
+        evaluate = self.evaluate
+        matches = []
+        for i, record in enumerate(records):
+            try:
+                if evaluate(record):
+                    matches.append(i)
+            except BudgetExceeded as e:
+                raise BudgetExceeded(f"record {i}: {e}") from None
+        return matches
+
+    def stats(self):
+        """The plan being evaluated and its budget, in the shape of AdaptiveRule.stats()"""
+        return {
+            'plan': rule_to_text(self.ast),
+            'evaluations': self.evaluations,
+            'reorders': 0,
+            'conditions': [],
+            'budget': {
+                'max_steps': self.budget.max_steps,
+                'timeout_ms': self.budget.timeout * 1000
+            }
+        }
+
+class _BudgetedCompiler(RuleCompiler):
+    """Compiles conditions that count themselves against a BudgetedRule's budget"""
+    def __init__(self, schema, state, budget):
+        super().__init__(schema)
+        self.state = state
+        self.budget = budget
+
+    def _compile_condition(self, condition):
+        matches = super()._compile_condition(condition)
+        state = self.state
+        max_steps = self.budget.max_steps
+        timeout = self.budget.timeout
+        check_every = self.budget.check_every
+        clock = time.perf_counter
+
+        def budgeted(user_data):
+            steps = state[0] = state[0] + 1
+            if max_steps and steps > max_steps:
+                raise BudgetExceeded(f"evaluated {max_steps} conditions without a result, the step budget")
+            if state[1] is not None and not steps % check_every and clock() > state[1]:
+                raise BudgetExceeded(f"ran for over {timeout * 1000:g} ms, the time budget")
+            return matches(user_data)
+
+        return budgeted
@@ -1,88 +1,354 @@
 # rule_database.py
+import asyncio
 import sqlite3
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from datetime import datetime
 
+RULE_COLUMNS = 'id, name, description, rule_text, created_at, updated_at, revision'
+RULE_AST_COLUMNS = RULE_COLUMNS + ', rule_ast, ast_format'
+
 class RuleDatabase:
-    def __init__(self, db_name='rules.db'):
+    """
+    Rule storage backed by SQLite.
+
+    Each thread keeps one open connection instead of connecting per call.
+    The database runs in WAL mode so readers don't wait for a writer, and
+    every statement is a constant SQL string so sqlite3's per-connection
+    statement cache reuses the prepared statement.
+
+    The *_async methods run the same calls on a small dedicated thread pool
+    so async code can await them without blocking the event loop.
+    """
+    def __init__(self, db_name='rules.db', max_workers=4):
         self.db_name = db_name
+        self.max_workers = max_workers
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._executor = None
         self.setup_database()
 
+    def _connect(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # check_same_thread is off only so close() can close every
+            # connection; each one is still used by a single thread
+            conn = sqlite3.connect(self.db_name, timeout=30, check_same_thread=False, cached_statements=256)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            conn.execute('PRAGMA cache_size=-16000')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """Close every connection opened by this instance"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    async def _run_async(self, fn, *args):
+        """Run a blocking database call on the pool and await its result"""
+        if self._executor is None:
+            with self._connections_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='rule-db')
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args))
+
+    @staticmethod
+    def _row_to_rule(row):
+        rule = {
+            'id': row[0],
+            'name': row[1],
+            'description': row[2],
+            'rule_text': row[3],
+            'created_at': row[4],
+            'updated_at': row[5],
+            'revision': row[6]
+        }
+        if len(row) > 7:
+            rule['rule_ast'] = row[7]
+            rule['ast_format'] = row[8]
+        return rule
+
     def setup_database(self):
-        """Create the rules table if it doesn't exist"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+        """Create the rules and attribute schema tables if they don't exist"""
+        conn = self._connect()
+        with conn:
+            conn.execute('''
                 CREATE TABLE IF NOT EXISTS rules (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     name TEXT NOT NULL UNIQUE,
                     description TEXT,
                     rule_text TEXT NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    rule_ast BLOB,
+                    ast_format INTEGER,
+                    revision INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+
+            # Databases created before serialized rules were stored
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(rules)')}
+            if 'rule_ast' not in columns:
+                conn.execute('ALTER TABLE rules ADD COLUMN rule_ast BLOB')
+            if 'ast_format' not in columns:
+                conn.execute('ALTER TABLE rules ADD COLUMN ast_format INTEGER')
+            if 'revision' not in columns:
+                conn.execute('ALTER TABLE rules ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+
+            # Every insert, edit and delete bumps a database-wide revision and
+            # stamps it on the row (or a tombstone), so other processes can
+            # find what changed since the revision they last saw
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rule_revision (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    value INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('INSERT OR IGNORE INTO rule_revision (id, value) VALUES (1, 0)')
+            revision_columns = {row[1] for row in conn.execute('PRAGMA table_info(rule_revision)')}
+            if 'schema_revision' not in revision_columns:
+                conn.execute('ALTER TABLE rule_revision ADD COLUMN schema_revision INTEGER NOT NULL DEFAULT 0')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS deleted_rules (
+                    name TEXT PRIMARY KEY,
+                    revision INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS rules_after_insert AFTER INSERT ON rules
+                BEGIN
+                    UPDATE rule_revision SET value = value + 1 WHERE id = 1;
+                    UPDATE rules SET revision = (SELECT value FROM rule_revision WHERE id = 1) WHERE id = NEW.id;
+                    DELETE FROM deleted_rules WHERE name = NEW.name;
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS rules_after_update
+                AFTER UPDATE OF name, description, rule_text, updated_at ON rules
+                BEGIN
+                    UPDATE rule_revision SET value = value + 1 WHERE id = 1;
+                    UPDATE rules SET revision = (SELECT value FROM rule_revision WHERE id = 1) WHERE id = NEW.id;
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS rules_after_delete AFTER DELETE ON rules
+                BEGIN
+                    UPDATE rule_revision SET value = value + 1 WHERE id = 1;
+                    INSERT OR REPLACE INTO deleted_rules (name, revision)
+                    VALUES (OLD.name, (SELECT value FROM rule_revision WHERE id = 1));
+                END
+            ''')
+
+            # Optional declared type per attribute. Every rule is compiled
+            # against it, so a change restamps all rules for other processes
+            # to recompile, and drops the stored trees, which were optimized
+            # for the old types, so they are rebuilt from rule_text
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS attribute_schema (
+                    field TEXT PRIMARY KEY,
+                    type TEXT NOT NULL
                 )
             ''')
-            conn.commit()
-
-    def save_rule(self, name: str, rule_text: str, description: str = None):
-        """Save a new rule or update existing one"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            try:
-                cursor.execute('''
-                    INSERT INTO rules (name, rule_text, description)
-                    VALUES (?, ?, ?)
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS attribute_schema_after_{event.lower()}
+                    AFTER {event} ON attribute_schema
+                    BEGIN
+                        UPDATE rule_revision SET value = value + 1, schema_revision = value + 1 WHERE id = 1;
+                        UPDATE rules SET revision = (SELECT value FROM rule_revision WHERE id = 1), rule_ast = NULL;
+                    END
+                ''')
+
+            # Seconds per evaluation of each class of condition (see
+            # rule_cost), timed once so every process prices rules alike
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS condition_costs (
+                    cost_class TEXT PRIMARY KEY,
+                    seconds REAL NOT NULL
+                )
+            ''')
+
+    def save_rule(self, name: str, rule_text: str, description: str = None,
+                  rule_ast: bytes = None, ast_format: int = None):
+        """
+        Save a new rule or update existing one
+        rule_ast/ast_format: optional serialized tree (see rule_serializer)
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute('''
+                    INSERT INTO rules (name, rule_text, description, rule_ast, ast_format)
+                    VALUES (?, ?, ?, ?, ?)
                     ON CONFLICT(name) DO UPDATE SET
                         rule_text = excluded.rule_text,
                         description = excluded.description,
+                        rule_ast = excluded.rule_ast,
+                        ast_format = excluded.ast_format,
                         updated_at = CURRENT_TIMESTAMP
-                ''', (name, rule_text, description))
-                conn.commit()
-                return cursor.lastrowid
-            except sqlite3.Error as e:
-                print(f"Error saving rule: {e}")
-                return None
-
-    def get_rule(self, name: str):
-        """Retrieve a rule by name"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM rules WHERE name = ?', (name,))
-            result = cursor.fetchone()
-            if result:
-                return {
-                    'id': result[0],
-                    'name': result[1],
-                    'description': result[2],
-                    'rule_text': result[3],
-                    'created_at': result[4],
-                    'updated_at': result[5]
-                }
+                    RETURNING id
+                ''', (name, rule_text, description, rule_ast, ast_format))
+                return cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Error saving rule: {e}")
             return None
 
-    def get_all_rules(self):
+    def save_rules(self, rows):
+        """
+        Save many (name, rule_text, description, rule_ast, ast_format) rows,
+        inserting or updating each as save_rule does, in one transaction.
+        Returns the number of rows written, or None if nothing was written.
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT INTO rules (name, rule_text, description, rule_ast, ast_format)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET
+                        rule_text = excluded.rule_text,
+                        description = excluded.description,
+                        rule_ast = excluded.rule_ast,
+                        ast_format = excluded.ast_format,
+                        updated_at = CURRENT_TIMESTAMP
+                ''', rows)
+            return len(rows)
+        except sqlite3.Error as e:
+            print(f"Error saving rules: {e}")
+            return None
+
+    def update_rule_asts(self, entries):
+        """Store (rule_ast, ast_format, id) tuples in one transaction"""
+        conn = self._connect()
+        with conn:
+            conn.executemany('UPDATE rules SET rule_ast = ?, ast_format = ? WHERE id = ?', entries)
+
+    def get_rule(self, name: str, include_ast: bool = False):
+        """Retrieve a rule by name"""
+        columns = RULE_AST_COLUMNS if include_ast else RULE_COLUMNS
+        cursor = self._connect().execute(f'SELECT {columns} FROM rules WHERE name = ?', (name,))
+        result = cursor.fetchone()
+        if result:
+            return self._row_to_rule(result)
+        return None
+
+    def get_all_rules(self, include_ast: bool = False):
         """Retrieve all rules"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM rules')
-            results = cursor.fetchall()
-            return [{
-                'id': r[0],
-                'name': r[1],
-                'description': r[2],
-                'rule_text': r[3],
-                'created_at': r[4],
-                'updated_at': r[5]
-            } for r in results]
+        columns = RULE_AST_COLUMNS if include_ast else RULE_COLUMNS
+        cursor = self._connect().execute(f'SELECT {columns} FROM rules')
+        return [self._row_to_rule(r) for r in cursor.fetchall()]
+
+    def get_schema(self):
+        """Return the attribute schema as a field -> type dict"""
+        return dict(self._connect().execute('SELECT field, type FROM attribute_schema').fetchall())
+
+    def set_attribute_type(self, field: str, attribute_type: str):
+        """Declare or change the type of an attribute"""
+        conn = self._connect()
+        with conn:
+            conn.execute('''
+                INSERT INTO attribute_schema (field, type) VALUES (?, ?)
+                ON CONFLICT(field) DO UPDATE SET type = excluded.type
+            ''', (field, attribute_type))
+
+    def delete_attribute_type(self, field: str):
+        """Remove an attribute from the schema"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute('DELETE FROM attribute_schema WHERE field = ?', (field,))
+            return cursor.rowcount > 0
+
+    def get_condition_costs(self):
+        """Return the stored condition costs as a class -> seconds dict"""
+        return dict(self._connect().execute('SELECT cost_class, seconds FROM condition_costs').fetchall())
+
+    def save_condition_costs(self, costs):
+        """
+        Store condition costs for the classes that have none yet; costs
+        another process stored first are kept. Returns the stored costs.
+        """
+        conn = self._connect()
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO condition_costs (cost_class, seconds) VALUES (?, ?)',
+                             list(costs.items()))
+        return self.get_condition_costs()
+
+    def get_revision(self):
+        """Current database-wide rules revision"""
+        return self._connect().execute('SELECT value FROM rule_revision WHERE id = 1').fetchone()[0]
+
+    def get_rule_changes(self, since: int):
+        """
+        Return (revision, changed rules with blobs, deleted rule names,
+        schema) for everything written after revision since, read from one
+        snapshot. schema is None unless the attribute schema changed.
+        """
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            revision, schema_revision = conn.execute(
+                'SELECT value, schema_revision FROM rule_revision WHERE id = 1').fetchone()
+            if revision == since:
+                return revision, [], [], None
+            changed = conn.execute(f'SELECT {RULE_AST_COLUMNS} FROM rules WHERE revision > ?', (since,)).fetchall()
+            deleted = conn.execute('SELECT name FROM deleted_rules WHERE revision > ?', (since,)).fetchall()
+            schema = None
+            if schema_revision > since:
+                schema = dict(conn.execute('SELECT field, type FROM attribute_schema').fetchall())
+            return revision, [self._row_to_rule(r) for r in changed], [r[0] for r in deleted], schema
+        finally:
+            conn.execute('COMMIT')
 
     def delete_rule(self, name: str):
         """Delete a rule by name"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM rules WHERE name = ?', (name,))
-            conn.commit()
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute('DELETE FROM rules WHERE name = ?', (name,))
             return cursor.rowcount > 0
 
+    async def save_rule_async(self, name: str, rule_text: str, description: str = None,
+                              rule_ast: bytes = None, ast_format: int = None):
+        return await self._run_async(self.save_rule, name, rule_text, description, rule_ast, ast_format)
+
+    async def save_rules_async(self, rows):
+        return await self._run_async(self.save_rules, rows)
+
+    async def get_rule_async(self, name: str, include_ast: bool = False):
+        return await self._run_async(self.get_rule, name, include_ast)
+
+    async def get_all_rules_async(self, include_ast: bool = False):
+        return await self._run_async(self.get_all_rules, include_ast)
+
+    async def get_rule_changes_async(self, since: int):
+        return await self._run_async(self.get_rule_changes, since)
+
+    async def delete_rule_async(self, name: str):
+        return await self._run_async(self.delete_rule, name)
+
+    async def get_schema_async(self):
+        return await self._run_async(self.get_schema)
+
+    async def set_attribute_type_async(self, field: str, attribute_type: str):
+        return await self._run_async(self.set_attribute_type, field, attribute_type)
+
+    async def delete_attribute_type_async(self, field: str):
+        return await self._run_async(self.delete_attribute_type, field)
+
 # Test the database functionality
 def test_database():
     # Create database instance
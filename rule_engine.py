@@ -1,76 +1,163 @@
 # rule_engine.py
+import re
 
 class RuleNode:
-    def __init__(self, type_name, value=None):
-        self.type = type_name    # Can be "operator" (AND/OR) or "operand" (actual conditions)
-        self.value = value       # Stores the actual value (like "AND" or "age > 30")
-        self.left = None         # Left child node
-        self.right = None        # Right child node
+    # No per-instance __dict__; large rules allocate one small object per node
+    __slots__ = ('type', 'value', 'children')
+
+    def __init__(self, type_name, value=None, children=()):
+        self.type = type_name      # Can be "operator" (AND/OR) or "operand" (actual conditions)
+        self.value = value         # Stores the actual value (like "AND" or "age > 30")
+        self.children = children   # Operands of an AND/OR node in order; empty for conditions
 
     def __str__(self):
         return f"Node(type={self.type}, value={self.value})"
 
+class RuleSyntaxError(ValueError):
+    """Raised when rule text can't be parsed; position is the character offset"""
+    def __init__(self, message, position):
+        super().__init__(f"{message} at position {position}")
+        self.position = position
+
+class Token:
+    __slots__ = ('kind', 'text', 'position')
+
+    def __init__(self, kind, text, position):
+        self.kind = kind            # "(", ")", "AND", "OR", "COMPARISON", "STRING", "WORD" or "END"
+        self.text = text
+        self.position = position    # Offset of the token in the rule text
+
+    def __repr__(self):
+        return f"Token({self.kind}, {self.text!r}, {self.position})"
+
+class RuleTokenizer:
+    """Split rule text into tokens in a single left-to-right pass"""
+    _pattern = re.compile(r"""
+        (?P<space>\s+)
+      | (?P<paren>[()])
+      | (?P<comparison>>=|<=|!=|>|<|=)
+      | (?P<string>'[^']*')
+      | (?P<word>[^\s()'<>=!]+)
+    """, re.VERBOSE)
+
+    def tokenize(self, rule_text):
+        tokens = []
+        position = 0
+        length = len(rule_text)
+        match = self._pattern.match
+
+        while position < length:
+            m = match(rule_text, position)
+            if m is None:
+                if rule_text[position] == "'":
+                    raise RuleSyntaxError("Unterminated string", position)
+                raise RuleSyntaxError(f"Unexpected character {rule_text[position]!r}", position)
+
+            kind = m.lastgroup
+            text = m.group()
+            if kind == 'paren':
+                tokens.append(Token(text, text, position))
+            elif kind == 'comparison':
+                tokens.append(Token("COMPARISON", text, position))
+            elif kind == 'string':
+                tokens.append(Token("STRING", text, position))
+            elif kind == 'word':
+                if text == 'AND' or text == 'OR':
+                    tokens.append(Token(text, text, position))
+                else:
+                    tokens.append(Token("WORD", text, position))
+            position = m.end()
+
+        tokens.append(Token("END", "", length))
+        return tokens
+
+class TokenStream:
+    """Cursor over a token list; the END token is never consumed"""
+    __slots__ = ('tokens', 'index')
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.index = 0
+
+    def peek(self):
+        return self.tokens[self.index]
+
+    def advance(self):
+        token = self.tokens[self.index]
+        if token.kind != "END":
+            self.index += 1
+        return token
+
 class RuleParser:
+    """
+    Precedence-climbing parser over RuleTokenizer tokens.
+
+    OR binds looser than AND, operators of equal precedence associate to the
+    left, and each token is consumed exactly once, so parsing is linear in
+    the length of the rule.
+    """
     def __init__(self):
         self.operators = {'AND', 'OR'}
         self.comparisons = {'>', '<', '>=', '<=', '=', '!='}
+        self.precedence = {'OR': 1, 'AND': 2}
+        self.tokenizer = RuleTokenizer()
 
     def parse_rule(self, rule_text):
         """Convert a text rule into our RuleNode structure"""
-        # Remove extra spaces
-        rule_text = ' '.join(rule_text.split())
-        
-        # Handle parentheses
-        if rule_text.startswith('(') and rule_text.endswith(')'):
-            # Remove outer parentheses
-            rule_text = rule_text[1:-1]
-        
-        # First split by OR (lower precedence)
-        or_parts = self._split_by_operator(rule_text, 'OR')
-        
-        if len(or_parts) > 1:
-            root = RuleNode("operator", "OR")
-            root.left = self.parse_rule(or_parts[0])
-            root.right = self.parse_rule(or_parts[1])
-            return root
-            
-        # Then split by AND (higher precedence)
-        and_parts = self._split_by_operator(rule_text, 'AND')
-        
-        if len(and_parts) > 1:
-            root = RuleNode("operator", "AND")
-            root.left = self.parse_rule(and_parts[0])
-            root.right = self.parse_rule(and_parts[1])
-            return root
-            
-        # Base case: single condition
-        return RuleNode("operand", rule_text.strip())
-
-    def _split_by_operator(self, text, operator):
-        """Split text by operator, respecting parentheses"""
-        parts = []
-        current_part = ""
-        paren_count = 0
-        
-        words = text.split()
-        
-        for i, word in enumerate(words):
-            if word == '(':
-                paren_count += 1
-            elif word == ')':
-                paren_count -= 1
-                
-            if word == operator and paren_count == 0:
-                if current_part:
-                    parts.append(current_part.strip())
-                current_part = ""
+        stream = TokenStream(self.tokenizer.tokenize(rule_text))
+        root = self._parse_expression(stream, 1)
+        token = stream.peek()
+        if token.kind != "END":
+            raise RuleSyntaxError(f"Unexpected {token.text!r}", token.position)
+        return root
+
+    def _parse_expression(self, stream, min_precedence):
+        left = self._parse_primary(stream)
+        while True:
+            token = stream.peek()
+            precedence = self.precedence.get(token.kind)
+            if precedence is None or precedence < min_precedence:
+                return left
+            stream.advance()
+
+            right = self._parse_expression(stream, precedence + 1)
+
+            # Keep A AND B AND C as one n-ary node instead of a nested chain
+            if left.type == "operator" and left.value == token.kind:
+                node = left
             else:
-                current_part += " " + word if current_part else word
-                
-        if current_part:
-            parts.append(current_part.strip())
-            
-        return parts if len(parts) > 1 else [text]
+                node = RuleNode("operator", token.kind, [left])
+            if right.type == "operator" and right.value == token.kind:
+                node.children.extend(right.children)
+            else:
+                node.children.append(right)
+            left = node
+
+    def _parse_primary(self, stream):
+        token = stream.advance()
+        if token.kind == "(":
+            node = self._parse_expression(stream, 1)
+            closing = stream.advance()
+            if closing.kind != ")":
+                raise RuleSyntaxError(f"Expected ')' to close '(' from position {token.position}", closing.position)
+            return node
+
+        if token.kind == "WORD":
+            return self._parse_condition(stream, token)
+
+        if token.kind == "END":
+            raise RuleSyntaxError("Expected a condition but the rule ended", token.position)
+        raise RuleSyntaxError(f"Expected a condition but found {token.text!r}", token.position)
+
+    def _parse_condition(self, stream, field):
+        """Parse 'field operator value' into an operand node"""
+        operator = stream.advance()
+        if operator.kind != "COMPARISON":
+            raise RuleSyntaxError(f"Expected a comparison operator after {field.text!r}", operator.position)
+        value = stream.advance()
+        if value.kind != "WORD" and value.kind != "STRING":
+            raise RuleSyntaxError(f"Expected a value after {operator.text!r}", value.position)
+        return RuleNode("operand", f"{field.text} {operator.text} {value.text}")
 
 class RuleEvaluator:
     def evaluate_rule(self, rule_node, user_data):
@@ -79,21 +166,40 @@ class RuleEvaluator:
         rule_node: Our RuleNode structure
         user_data: Dictionary with user information
         """
-        # If it's an operator node (AND/OR)
-        if rule_node.type == "operator":
-            left_result = self.evaluate_rule(rule_node.left, user_data)
-            right_result = self.evaluate_rule(rule_node.right, user_data)
-            
-            if rule_node.value == "AND":
-                return left_result and right_result
-            elif rule_node.value == "OR":
-                return left_result or right_result
-        
-        # If it's a condition node
-        elif rule_node.type == "operand":
-            return self._evaluate_condition(rule_node.value, user_data)
-            
-        return False
+        # Walk the tree with an explicit stack so deeply nested rules can't
+        # hit Python's recursion limit. Every child of an AND/OR is evaluated
+        # and its result pushed; the operator then combines the last len(children)
+        results = []
+        stack = [(rule_node, False)]
+        while stack:
+            node, children_done = stack.pop()
+
+            # If it's a condition node
+            if node.type == "operand":
+                results.append(self._evaluate_condition(node.value, user_data))
+
+            # If it's an operator node (AND/OR)
+            elif node.type == "operator" and not children_done:
+                stack.append((node, True))
+                for child in reversed(node.children):
+                    stack.append((child, False))
+
+            elif node.type == "operator":
+                count = len(node.children)
+                child_results = results[len(results) - count:]
+                del results[len(results) - count:]
+
+                if node.value == "AND":
+                    results.append(all(child_results))
+                elif node.value == "OR":
+                    results.append(any(child_results))
+                else:
+                    results.append(False)
+
+            else:
+                results.append(False)
+
+        return results[0]
 
     def _evaluate_condition(self, condition, user_data):
         """Evaluate a single condition like 'age > 30' or "department = 'Sales'"""
@@ -141,15 +247,16 @@ class RuleEvaluator:
 
 def print_rule_tree(node, prefix=""):
     """Helper function to print the rule tree structure"""
-    if not node:
-        return
-        
-    print(f"{prefix}└─ {node}")
-    
-    if node.left:
-        print_rule_tree(node.left, prefix + "   ")
-    if node.right:
-        print_rule_tree(node.right, prefix + "   ")
+    stack = [(node, prefix)]
+    while stack:
+        node, prefix = stack.pop()
+        if not node:
+            continue
+
+        print(f"{prefix}└─ {node}")
+
+        for child in reversed(node.children):
+            stack.append((child, prefix + "   "))
 
 def test_rules():
     parser = RuleParser()
@@ -0,0 +1,233 @@
+# rule_metrics.py
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds, from a cached compiled rule to a slow request
+LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+                   1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 0.1, 1.0)
+
+class Histogram:
+    """Counts of observed values per bucket, plus their sum"""
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)    # The last bucket is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def samples(self, labels):
+        """
+        (suffix, labels, value) tuples with cumulative buckets, as Prometheus
+        expects; labels is preformatted label text like 'rule="a"'
+        """
+        samples = []
+        total = 0
+        prefix = labels + ',' if labels else ''
+        for le, count in zip(_bucket_labels(self.bounds), self.counts):
+            total += count
+            samples.append(('_bucket', prefix + le, total))
+        samples.append(('_sum', labels, self.sum))
+        samples.append(('_count', labels, total))
+        return samples
+
+_le_cache = {}
+
+def _bucket_labels(bounds):
+    labels = _le_cache.get(bounds)
+    if labels is None:
+        labels = _le_cache[bounds] = [f'le="{_format_value(bound)}"' for bound in bounds + (_INF,)]
+    return labels
+
+class RuleMetrics:
+    """
+    Request stage timings and per-rule evaluation statistics.
+
+    observe_stage() records how long one stage of a request took, and
+    observe_rule() one evaluation of a rule: its latency and whether it
+    matched. observe_batch() adds a batch of evaluations to a rule's counts
+    without touching its latency histogram, and observe_error() and
+    observe_abort() count evaluations that raised an error or went over
+    their budget. Each call is a couple of list updates; nothing is
+    aggregated until families() is called. Updates aren't locked, so they
+    must all come from one thread (the event loop's).
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.stages = {}    # stage -> Histogram
+        self.rules = {}     # rule name -> [evaluations, matches, errors, Histogram, aborts]
+
+    def observe_stage(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def observe_rule(self, name, seconds, matched):
+        entry = self.rules.get(name)
+        if entry is None:
+            entry = self.rules[name] = [0, 0, 0, Histogram(self.buckets), 0]
+        entry[0] += 1
+        if matched:
+            entry[1] += 1
+        entry[3].observe(seconds)
+
+    def observe_batch(self, name, evaluations, matches):
+        entry = self.rules.get(name)
+        if entry is None:
+            entry = self.rules[name] = [0, 0, 0, Histogram(self.buckets), 0]
+        entry[0] += evaluations
+        entry[1] += matches
+
+    def observe_error(self, name):
+        entry = self.rules.get(name)
+        if entry is None:
+            entry = self.rules[name] = [0, 0, 0, Histogram(self.buckets), 0]
+        entry[2] += 1
+
+    def observe_abort(self, name):
+        entry = self.rules.get(name)
+        if entry is None:
+            entry = self.rules[name] = [0, 0, 0, Histogram(self.buckets), 0]
+        entry[4] += 1
+
+    def forget(self, name):
+        """Drop a deleted rule's statistics"""
+        self.rules.pop(name, None)
+
+    def families(self):
+        """Metric families as (name, type, help, samples) for render_prometheus"""
+        stage_samples = []
+        for stage, histogram in sorted(self.stages.items()):
+            stage_samples.extend(histogram.samples(f'stage="{_escape_label(stage)}"'))
+
+        evaluations, matches, errors, aborts, ratios, latencies = [], [], [], [], [], []
+        for name, (count, matched, failed, histogram, aborted) in sorted(self.rules.items()):
+            labels = f'rule="{_escape_label(name)}"'
+            evaluations.append(('', labels, count))
+            matches.append(('', labels, matched))
+            errors.append(('', labels, failed))
+            aborts.append(('', labels, aborted))
+            ratios.append(('', labels, matched / count if count else 0.0))
+            latencies.extend(histogram.samples(labels))
+
+        return [
+            ('rule_engine_stage_seconds', 'histogram', 'Time spent in each stage of a request', stage_samples),
+            ('rule_engine_rule_evaluations_total', 'counter', 'Evaluations of each rule', evaluations),
+            ('rule_engine_rule_matches_total', 'counter', 'Evaluations of each rule that matched', matches),
+            ('rule_engine_rule_errors_total', 'counter', 'Evaluations of each rule that raised an error', errors),
+            ('rule_engine_rule_aborts_total', 'counter', 'Evaluations of each rule stopped for going over budget', aborts),
+            ('rule_engine_rule_match_ratio', 'gauge', 'Share of evaluations of each rule that matched', ratios),
+            ('rule_engine_rule_evaluation_seconds', 'histogram', 'Evaluation latency of each rule', latencies)
+        ]
+
+def stats_families(prefix, help_text, stats, counters=()):
+    """
+    Turn a stats() dict of numbers into one family per key: counters for the
+    keys in counters (named *_total), gauges for the rest
+    """
+    families = []
+    for key, value in stats.items():
+        if not isinstance(value, (int, float)):
+            continue
+        if key in counters:
+            families.append((f'{prefix}_{key}_total', 'counter', f'{help_text}: {key}', [('', '', value)]))
+        else:
+            families.append((f'{prefix}_{key}', 'gauge', f'{help_text}: {key}', [('', '', value)]))
+    return families
+
+_INF = float('inf')
+
+def _format_value(value):
+    if value == _INF:
+        return '+Inf'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus(families):
+    """
+    Render metric families in the Prometheus text exposition format. Each
+    family is (name, type, help, samples) and each sample (name suffix,
+    label text such as 'rule="a"' or '', value).
+    """
+    lines = []
+    for name, metric_type, help_text, samples in families:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for suffix, labels, value in samples:
+            if labels:
+                lines.append(f'{name}{suffix}{{{labels}}} {_format_value(value)}')
+            else:
+                lines.append(f'{name}{suffix} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+class SamplingProfiler:
+    """
+    Sample one thread's stack at a fixed interval from a background thread.
+
+    profile() returns the samples in the folded format flamegraph.pl and
+    speedscope read: one line per distinct stack, frames from the outermost
+    in, separated by semicolons, followed by the number of samples. Samples
+    taken while the thread waits in the event loop's selector are left out,
+    so the profile shows only where time goes while work is being done.
+    The sampled thread runs at full speed; each sample costs the profiler
+    thread a walk of the stack and holds the GIL while it does.
+    """
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def profile(self, seconds, interval=0.005):
+        """Sample for seconds and return (folded stacks text, sample count, idle samples)"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already being taken")
+        try:
+            stacks = {}
+            samples = idle = 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is None:
+                    break
+                samples += 1
+                if _is_idle(frame):
+                    idle += 1
+                else:
+                    stack = _fold(frame)
+                    stacks[stack] = stacks.get(stack, 0) + 1
+                del frame
+                time.sleep(interval)
+            text = ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+            return text, samples, idle
+        finally:
+            self._lock.release()
+
+def _is_idle(frame):
+    return frame.f_code.co_name in ('select', 'poll') and frame.f_code.co_filename.endswith('selectors.py')
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        names.append(f'{module}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
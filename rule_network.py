@@ -0,0 +1,204 @@
+# rule_network.py
+import threading
+from operator import itemgetter
+
+from rule_engine import RuleParser
+from rule_compiler import RuleCompiler, _MISSING, _always_false
+from rule_cache import RuleCache
+
+class _PredicateCompiler(RuleCompiler):
+    """Compiles rules whose conditions read a shared predicate result list"""
+    def __init__(self, network):
+        super().__init__(network.schema)
+        self.network = network
+        self.keys = []    # Predicate keys used by the rule being compiled
+
+    def _compile_condition(self, condition):
+        parsed = self.parse_condition(condition)
+        if parsed is None:
+            return super()._compile_condition(condition)
+        self.keys.append(parsed.key)
+        return itemgetter(self.network._acquire_predicate(parsed))
+
+class _RecordCompiler(RuleCompiler):
+    """Compiles rules that read the record directly, treating a TypeError as no match"""
+    def _compile_condition(self, condition):
+        parsed = self.parse_condition(condition)
+        if parsed is None:
+            return _always_false
+
+        field = parsed.field
+        matches = parsed.value_matcher()
+
+        def condition_matches(user_data):
+            actual = user_data.get(field, _MISSING)
+            if actual is _MISSING:
+                return False
+            try:
+                return matches(actual)
+            except TypeError:
+                return False
+
+        return condition_matches
+
+class RuleNetwork:
+    """
+    Discrimination network over every stored rule.
+
+    Each distinct condition (field, operator, value) becomes one predicate
+    slot, no matter how many rules use it. Matching a record evaluates every
+    predicate on the record's fields once, then runs each rule as a compiled
+    AND/OR over the predicate results. Rules are added, replaced and removed
+    one at a time, so changing a rule never rebuilds the whole network.
+
+    The network also indexes rules by the fields they read, so after a
+    record changes only the rules reading a changed field are re-run
+    (see evaluate_changes).
+
+    A comparison the evaluator would reject (e.g. a number against a
+    non-numeric string with >) counts as no match here instead of failing
+    every rule in the call. The same goes for a value whose type differs
+    from the one schema declares for its field.
+    """
+    def __init__(self, schema=None):
+        self.parser = RuleParser()
+        self.schema = schema if schema is not None else {}
+        self._lock = threading.Lock()
+        self._rules = {}          # name -> (version, predicate keys, compiled program)
+        self._rules_by_field = {} # field -> set of names of rules reading it
+        self._record_programs = {}  # name -> short-circuiting program over the record itself
+        self._predicates = {}     # key -> [slot, reference count]
+        self._by_field = {}       # field -> {slot: value matcher}
+        self._free_slots = []
+        self._slot_count = 0
+
+    def _acquire_predicate(self, condition):
+        """Return the slot for a condition, creating it on first use"""
+        entry = self._predicates.get(condition.key)
+        if entry is not None:
+            entry[1] += 1
+            return entry[0]
+
+        slot = self._free_slots.pop() if self._free_slots else self._slot_count
+        if slot == self._slot_count:
+            self._slot_count += 1
+        self._predicates[condition.key] = [slot, 1]
+        self._by_field.setdefault(condition.field, {})[slot] = condition.value_matcher()
+        return slot
+
+    def _release_predicates(self, keys):
+        for key in keys:
+            entry = self._predicates[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._predicates[key]
+                field_slots = self._by_field[key[0]]
+                del field_slots[entry[0]]
+                if not field_slots:
+                    del self._by_field[key[0]]
+                self._free_slots.append(entry[0])
+
+    def update_rule(self, rule, rule_ast=None):
+        """Add or replace a rule row from RuleDatabase"""
+        if rule_ast is None:
+            rule_ast = self.parser.parse_rule(rule['rule_text'])
+
+        record_program = _RecordCompiler(self.schema).compile_rule(rule_ast).predicate
+        with self._lock:
+            compiler = _PredicateCompiler(self)
+            program = compiler.compile_rule(rule_ast).predicate
+            previous = self._rules.get(rule['name'])
+            self._rules[rule['name']] = (RuleCache.version_of(rule), compiler.keys, program)
+            if previous is not None:
+                self._unindex_rule(rule['name'], previous[1])
+                self._release_predicates(previous[1])
+            for field in {key[0] for key in compiler.keys}:
+                self._rules_by_field.setdefault(field, set()).add(rule['name'])
+            self._record_programs[rule['name']] = record_program
+
+    def _unindex_rule(self, name, keys):
+        self._record_programs.pop(name, None)
+        for field in {key[0] for key in keys}:
+            names = self._rules_by_field[field]
+            names.discard(name)
+            if not names:
+                del self._rules_by_field[field]
+
+    def remove_rule(self, name):
+        with self._lock:
+            previous = self._rules.pop(name, None)
+            if previous is not None:
+                self._unindex_rule(name, previous[1])
+                self._release_predicates(previous[1])
+
+    def sync(self, rules, load_ast=None):
+        """
+        Bring the network in line with a full list of rule rows, touching
+        only rules that were added, changed or deleted since the last sync.
+        load_ast(rule) builds the tree for a row; by default rule_text is parsed.
+        """
+        names = set()
+        for rule in rules:
+            names.add(rule['name'])
+            current = self._rules.get(rule['name'])
+            if current is None or current[0] != RuleCache.version_of(rule):
+                try:
+                    self.update_rule(rule, load_ast(rule) if load_ast else None)
+                except ValueError as e:
+                    print(f"Skipping rule {rule['name']}: {e}")
+                    self.remove_rule(rule['name'])
+
+        for name in list(self._rules):
+            if name not in names:
+                self.remove_rule(name)
+
+    def match(self, user_data):
+        """Return the names of every rule that user_data satisfies"""
+        with self._lock:
+            results = [False] * self._slot_count
+            for field, actual in user_data.items():
+                field_slots = self._by_field.get(field)
+                if field_slots is None:
+                    continue
+                for slot, matches in field_slots.items():
+                    try:
+                        results[slot] = matches(actual)
+                    except TypeError:
+                        pass
+
+            return [name for name, (_, _, program) in self._rules.items() if program(results)]
+
+    def evaluate_changes(self, user_data, changed_fields, previous):
+        """
+        Re-evaluate the rules a record change can affect.
+
+        user_data is the record after the change, changed_fields the fields
+        that were set, changed or removed, and previous the set of names of
+        the rules the record matched before (e.g. from match()). Returns
+        {rule name: matches now} for just the rules whose result changed;
+        rules that don't read a changed field keep their previous result.
+        """
+        with self._lock:
+            affected = set()
+            for field in changed_fields:
+                affected.update(self._rules_by_field.get(field, ()))
+            if not affected:
+                return {}
+
+            # A few hundred rules are cheaper to run one by one, short-circuiting,
+            # than to evaluate every predicate they share
+            programs = self._record_programs
+            changes = {}
+            for name in affected:
+                matched = bool(programs[name](user_data))
+                if matched != (name in previous):
+                    changes[name] = matched
+            return changes
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rules': len(self._rules),
+                'predicates': len(self._predicates),
+                'predicate_references': sum(entry[1] for entry in self._predicates.values())
+            }
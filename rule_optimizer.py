@@ -0,0 +1,224 @@
+# rule_optimizer.py
+from rule_engine import RuleNode
+from rule_compiler import RuleCompiler
+
+# A condition that isn't "field operator value" never matches, in every
+# evaluator, so a one-word operand stands for a branch that is always false
+FALSE_CONDITION = 'FALSE'
+
+LOWER_BOUNDS = ('>', '>=')
+UPPER_BOUNDS = ('<', '<=')
+
+def count_nodes(rule_node):
+    count = 0
+    stack = [rule_node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
+
+def _sign(a, b):
+    return (a > b) - (a < b)
+
+def _order(a, b):
+    """
+    Compare the literals of two conditions the way values are compared
+    against them. A number literal is compared numerically with digit
+    values and as a string with anything else, so two number literals are
+    only ordered when both comparisons agree. Literals of a typed field are
+    compared as the converted values. Returns -1, 0, 1 or None.
+    """
+    if a.kind is not None or b.kind is not None:
+        return _sign(a.literal, b.literal) if a.kind == b.kind else None
+    if (a.number is None) != (b.number is None):
+        return None
+    text_order = _sign(a.value, b.value)
+    if a.number is None:
+        return text_order
+    number_order = _sign(a.number, b.number)
+    return number_order if number_order == text_order else None
+
+def _implies(stronger, weaker):
+    """Whether every value passing bound stronger also passes bound weaker"""
+    order = _order(stronger, weaker)
+    if order is None:
+        return False
+    if stronger.operator in LOWER_BOUNDS:
+        return order > 0 or (order == 0 and (stronger.operator == '>' or weaker.operator == '>='))
+    return order < 0 or (order == 0 and (stronger.operator == '<' or weaker.operator == '<='))
+
+def _exact(condition):
+    """
+    The value a condition's literal is compared as, when that doesn't
+    depend on the record: the converted literal of a typed field or a
+    number literal. None otherwise.
+    """
+    if condition.kind is not None:
+        return condition.literal
+    return condition.number
+
+def _in_range(value, bound):
+    """Whether a value passes a bound whose literal has an exact value"""
+    return bound.compare(value, _exact(bound))
+
+class RuleOptimizer:
+    """
+    Simplify a RuleNode tree without changing which records it matches.
+
+    The pass flattens nested AND/OR nodes, drops duplicate children and
+    children absorbed by a sibling (A AND (A OR B) is A), folds branches
+    that can never match, and merges bounds on the same field: in an AND
+    the tightest bounds are kept and an empty range makes the whole AND
+    false, in an OR the loosest are kept.
+
+    Conditions that compare a field with a number match digit values
+    numerically and other strings alphabetically, so two such bounds are
+    only merged when both orders agree on which is tighter. Fields typed
+    by schema are merged using the typed order. Records for which the
+    original rule raises a TypeError may get a result instead.
+    """
+    def __init__(self, schema=None):
+        self.compiler = RuleCompiler(schema)
+
+    def optimize(self, rule_node):
+        """Return (optimized tree, number of nodes eliminated)"""
+        optimized = self._optimize_node(rule_node)
+        return optimized, count_nodes(rule_node) - count_nodes(optimized)
+
+    def _optimize_node(self, node):
+        if node.type == "operand":
+            if self.compiler.parse_condition(node.value) is None:
+                return RuleNode("operand", FALSE_CONDITION)
+            return node
+        if node.type != "operator" or node.value not in ('AND', 'OR') or not node.children:
+            return RuleNode("operand", FALSE_CONDITION)
+
+        op = node.value
+        children = []
+        keys = set()
+        stack = list(reversed(node.children))
+        while stack:
+            child = stack.pop()
+            if child.type == "operator" and child.value == op:
+                stack.extend(reversed(child.children))
+                continue
+            child = self._optimize_node(child)
+            # Optimizing a child can leave a node of this operator to splice in
+            if child.type == "operator" and child.value == op:
+                stack.extend(reversed(child.children))
+                continue
+            if child.type == "operand" and child.value == FALSE_CONDITION:
+                if op == 'AND':
+                    return child
+                continue
+            key = self._key(child)
+            if key not in keys:
+                keys.add(key)
+                children.append(child)
+
+        # A AND (A OR B) is A, and A OR (A AND B) is A
+        children = [
+            child for child in children
+            if child.type == "operand" or not any(self._key(grandchild) in keys for grandchild in child.children)
+        ]
+
+        children = self._merge_bounds(op, children)
+        if not children:
+            return RuleNode("operand", FALSE_CONDITION)
+        if len(children) == 1:
+            return children[0]
+        return RuleNode("operator", op, children)
+
+    def _key(self, node):
+        """Structural identity, ignoring child order and quoting of literals"""
+        if node.type == "operand":
+            parsed = self.compiler.parse_condition(node.value)
+            return parsed.key if parsed is not None else FALSE_CONDITION
+        return (node.value, frozenset(self._key(child) for child in node.children))
+
+    def _merge_bounds(self, op, children):
+        """
+        Merge the conditions among children that share a field. Returns the
+        children to keep, or an empty list if the AND can never match.
+        """
+        by_field = {}
+        for child in children:
+            if child.type == "operand":
+                parsed = self.compiler.parse_condition(child.value)
+                by_field.setdefault(parsed.field, []).append((child, parsed))
+
+        dropped = set()
+        for conditions in by_field.values():
+            if len(conditions) < 2:
+                continue
+            merge = self._merge_and if op == 'AND' else self._merge_or
+            field_dropped = merge(conditions)
+            if field_dropped is None:
+                return []
+            dropped.update(field_dropped)
+
+        return [child for child in children if id(child) not in dropped]
+
+    @staticmethod
+    def _tightest(conditions, tightest):
+        """
+        Reduce bounds of one direction to the tightest (or loosest) ones,
+        returning (kept, dropped node ids)
+        """
+        kept = []
+        dropped = set()
+        for node, parsed in conditions:
+            if any(_implies(other, parsed) if tightest else _implies(parsed, other) for _, other in kept):
+                dropped.add(id(node))
+                continue
+            remaining = []
+            for other_node, other in kept:
+                if _implies(parsed, other) if tightest else _implies(other, parsed):
+                    dropped.add(id(other_node))
+                else:
+                    remaining.append((other_node, other))
+            remaining.append((node, parsed))
+            kept = remaining
+        return kept, dropped
+
+    def _merge_and(self, conditions):
+        lowers, lower_dropped = self._tightest([c for c in conditions if c[1].operator in LOWER_BOUNDS], True)
+        uppers, upper_dropped = self._tightest([c for c in conditions if c[1].operator in UPPER_BOUNDS], True)
+        dropped = lower_dropped | upper_dropped
+
+        for _, lower in lowers:
+            for _, upper in uppers:
+                order = _order(lower, upper)
+                if order is not None and (order > 0 or (order == 0 and not (lower.operator == '>=' and upper.operator == '<='))):
+                    return None
+
+        # Equality with a number only matches digit values, so it is checked
+        # against the other number conditions numerically (typed literals by
+        # their type). Different equalities on one field can never hold together.
+        equals = [c for c in conditions if c[1].operator == '=']
+        values = {_exact(parsed) if _exact(parsed) is not None else parsed.value for _, parsed in equals}
+        if len(values) > 1:
+            return None
+        if equals and _exact(equals[0][1]) is not None:
+            value = _exact(equals[0][1])
+            for node, parsed in lowers + uppers + [c for c in conditions if c[1].operator == '!=']:
+                if _exact(parsed) is None:
+                    continue
+                if not _in_range(value, parsed):
+                    return None
+                dropped.add(id(node))
+        return dropped
+
+    def _merge_or(self, conditions):
+        lowers, lower_dropped = self._tightest([c for c in conditions if c[1].operator in LOWER_BOUNDS], False)
+        uppers, upper_dropped = self._tightest([c for c in conditions if c[1].operator in UPPER_BOUNDS], False)
+        dropped = lower_dropped | upper_dropped
+
+        # An equality with a number inside one of the ranges adds nothing
+        exact_bounds = [parsed for _, parsed in lowers + uppers if _exact(parsed) is not None]
+        for node, parsed in conditions:
+            if parsed.operator == '=' and _exact(parsed) is not None:
+                if any(_in_range(_exact(parsed), bound) for bound in exact_bounds):
+                    dropped.add(id(node))
+        return dropped
@@ -0,0 +1,111 @@
+# rule_registry.py
+import asyncio
+from bisect import bisect_right
+
+class RuleRegistry:
+    """
+    Every stored rule held in memory, so reads never touch SQLite.
+
+    The registry remembers the database revision it last loaded. refresh()
+    compares it with the current revision (one single-row read) and, when
+    another process has written since, loads only the changed rows and
+    tombstones. poll() runs refresh() every poll_interval seconds, which
+    bounds how long a change made by another worker can go unseen.
+    Async refreshes run one at a time, and a snapshot older than the one
+    already applied is dropped, so a slow refresh can't roll rules back.
+
+    Listeners are called as listener(changed_rules, deleted_names) after
+    every load or refresh that found changes.
+
+    schema holds the attribute schema. It is updated in place, before the
+    listeners run, so compilers built on it see every change; a schema
+    change also marks every rule as changed.
+    """
+    def __init__(self, rule_db, poll_interval=1.0):
+        self.rule_db = rule_db
+        self.poll_interval = poll_interval
+        self.revision = None
+        self._rules = {}         # name -> rule row, including its serialized tree
+        self._listing = None     # Cached public rows for get_all_rules()
+        self._listing_ids = None # Their ids, for paging by id
+        self._listeners = []
+        self._refresh_lock = asyncio.Lock()
+        self.schema = {}
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def load(self, rules, revision, schema=None):
+        """Replace the registry contents with a full list of rule rows"""
+        if schema is not None:
+            self._set_schema(schema)
+        names = {rule['name'] for rule in rules}
+        deleted = [name for name in self._rules if name not in names]
+        self._rules = {rule['name']: rule for rule in rules}
+        self.revision = revision
+        self._changed(rules, deleted)
+
+    def get_rule(self, name):
+        return self._rules.get(name)
+
+    def get_all_rules(self):
+        """Rule rows without their serialized trees, as the API returns them"""
+        if self._listing is None:
+            self._listing = [
+                {key: value for key, value in rule.items() if key not in ('rule_ast', 'ast_format')}
+                for rule in sorted(self._rules.values(), key=lambda rule: rule['id'])
+            ]
+            self._listing_ids = [rule['id'] for rule in self._listing]
+        return self._listing
+
+    def get_rules_page(self, after=None, limit=100):
+        """
+        Return (rules, next cursor): up to limit rules with an id greater
+        than after, in id order. The cursor is the id to pass as after for
+        the next page, or None on the last page.
+        """
+        listing = self.get_all_rules()
+        start = bisect_right(self._listing_ids, after) if after is not None else 0
+        page = listing[start:start + limit]
+        return page, page[-1]['id'] if page and start + limit < len(listing) else None
+
+    def refresh(self):
+        """Apply writes made since the last load or refresh"""
+        self._apply(*self.rule_db.get_rule_changes(self.revision))
+
+    async def refresh_async(self):
+        # Serialized, so each refresh reads from the revision the last one applied
+        async with self._refresh_lock:
+            self._apply(*await self.rule_db.get_rule_changes_async(self.revision))
+
+    async def poll(self):
+        """Refresh forever; meant to run as a background task"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh_async()
+            except Exception as e:
+                print(f"Error refreshing rules: {e}")
+
+    def _set_schema(self, schema):
+        self.schema.clear()
+        self.schema.update(schema)
+
+    def _apply(self, revision, changed, deleted, schema=None):
+        if self.revision is not None and revision <= self.revision:
+            return
+        if schema is not None:
+            self._set_schema(schema)
+        for name in deleted:
+            self._rules.pop(name, None)
+        for rule in changed:
+            self._rules[rule['name']] = rule
+        self.revision = revision
+        self._changed(changed, deleted)
+
+    def _changed(self, changed, deleted):
+        self._listing = None
+        self._listing_ids = None
+        if changed or deleted:
+            for listener in self._listeners:
+                listener(changed, deleted)
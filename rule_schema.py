@@ -0,0 +1,73 @@
+# rule_schema.py
+from datetime import date
+
+# Attribute types a schema can declare, and the Python types a record value
+# of each may have. Dates are ISO 8601 strings, which sort chronologically.
+VALUE_TYPES = {
+    'int': (int,),
+    'float': (int, float),
+    'str': (str,),
+    'bool': (bool,),
+    'date': (str,)
+}
+ATTRIBUTE_TYPES = tuple(VALUE_TYPES)
+
+class SchemaError(ValueError):
+    """A rule or record that doesn't fit the attribute schema"""
+
+def convert_literal(field, operator, value, kind):
+    """
+    Convert a condition's literal to the type declared for its field,
+    raising SchemaError if it can't be or the operator makes no sense for it
+    """
+    try:
+        if kind == 'int':
+            return int(value)
+        if kind == 'float':
+            return float(value)
+        if kind == 'str':
+            return value
+        if kind == 'bool':
+            if operator not in ('=', '!='):
+                raise SchemaError(f"{field} is declared bool and can only be compared with = or !=")
+            lowered = value.lower()
+            if lowered not in ('true', 'false'):
+                raise ValueError(value)
+            return lowered == 'true'
+        if kind == 'date':
+            return date.fromisoformat(value).isoformat()
+    except SchemaError:
+        raise
+    except ValueError:
+        raise SchemaError(f"{field} is declared {kind} but the rule compares it with {value!r}")
+    raise SchemaError(f"Unknown attribute type for {field}: {kind}")
+
+def typed_matcher(field, kind, compare, literal):
+    """
+    Build a function testing a present field value against a converted
+    literal. Values are compared as they are; one of the wrong type raises
+    a TypeError, as comparing mismatched types does without a schema.
+    """
+    accepted = VALUE_TYPES[kind]
+    if len(accepted) == 1:
+        accepted_type = accepted[0]
+
+        def value_matches(actual):
+            if type(actual) is accepted_type:
+                return compare(actual, literal)
+            raise TypeError(f"{field} must be of type {kind}, got {type(actual).__name__}")
+
+        return value_matches
+
+    def value_matches(actual):
+        if type(actual) in accepted:
+            return compare(actual, literal)
+        raise TypeError(f"{field} must be of type {kind}, got {type(actual).__name__}")
+
+    return value_matches
+
+def validate_schema(schema):
+    """Raise SchemaError if a field -> type mapping names an unknown type"""
+    for field, kind in schema.items():
+        if kind not in VALUE_TYPES:
+            raise SchemaError(f"Unknown attribute type for {field}: {kind} (expected one of {', '.join(ATTRIBUTE_TYPES)})")
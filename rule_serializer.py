@@ -0,0 +1,108 @@
+# rule_serializer.py
+import marshal
+
+from rule_engine import RuleNode, RuleParser
+
+# Bump whenever the encoding or RuleNode layout changes; stored blobs with
+# another version are re-parsed from rule_text and rewritten
+FORMAT_VERSION = 1
+MAGIC = b'RN'
+
+class RuleSerializer:
+    """
+    Compact binary form of a RuleNode tree.
+
+    The tree is stored in pre-order as a flat tuple: a condition is its
+    value string and an AND/OR node is (operator, child count). Loading
+    rebuilds the nodes in one loop without tokenizing the rule text.
+    """
+    def dumps(self, rule_node):
+        items = []
+        stack = [rule_node]
+        while stack:
+            node = stack.pop()
+            if node.type == "operand":
+                items.append(node.value)
+            else:
+                items.append((node.value, len(node.children)))
+                stack.extend(reversed(node.children))
+        return MAGIC + bytes([FORMAT_VERSION]) + marshal.dumps(tuple(items))
+
+    def loads(self, blob):
+        if blob[:2] != MAGIC or len(blob) < 3:
+            raise ValueError("Not a serialized rule")
+        if blob[2] != FORMAT_VERSION:
+            raise ValueError(f"Serialized rule has format {blob[2]}, expected {FORMAT_VERSION}")
+        try:
+            items = marshal.loads(blob[3:])
+        except (EOFError, TypeError) as e:
+            raise ValueError(f"Corrupt serialized rule: {e}")
+
+        root = None
+        stack = []    # [node, children still to attach]
+        for item in items:
+            if type(item) is str:
+                node = RuleNode("operand", item)
+                remaining = 0
+            else:
+                node = RuleNode("operator", item[0], [])
+                remaining = item[1]
+
+            if stack:
+                parent = stack[-1]
+                parent[0].children.append(node)
+                parent[1] -= 1
+                if parent[1] == 0:
+                    stack.pop()
+            else:
+                root = node
+
+            if remaining:
+                stack.append([node, remaining])
+
+        if root is None or stack:
+            raise ValueError("Corrupt serialized rule: truncated tree")
+        return root
+
+class RuleLoader:
+    """
+    Build rule trees from RuleDatabase rows, using the stored blob when it
+    is in the current format and parsing rule_text otherwise
+    """
+    def __init__(self, parser=None, serializer=None):
+        self.parser = parser or RuleParser()
+        self.serializer = serializer or RuleSerializer()
+
+    def is_current(self, rule):
+        return rule.get('ast_format') == FORMAT_VERSION and rule.get('rule_ast') is not None
+
+    def load(self, rule):
+        """Return the RuleNode tree for a rule row"""
+        if self.is_current(rule):
+            try:
+                return self.serializer.loads(rule['rule_ast'])
+            except ValueError:
+                pass
+        return self.parser.parse_rule(rule['rule_text'])
+
+    def load_rows(self, rule_db):
+        """
+        Return every stored rule row with a blob in the current format,
+        regenerating missing or outdated blobs in a single transaction
+        """
+        rules = rule_db.get_all_rules(include_ast=True)
+        stale = []
+        for rule in rules:
+            if self.is_current(rule):
+                continue
+            try:
+                rule_ast = self.parser.parse_rule(rule['rule_text'])
+            except ValueError:
+                continue    # Left for the caller to report; rule_text is still loaded
+            rule['rule_ast'] = self.serializer.dumps(rule_ast)
+            rule['ast_format'] = FORMAT_VERSION
+            stale.append((rule['rule_ast'], FORMAT_VERSION, rule['id']))
+
+        if stale:
+            rule_db.update_rule_asts(stale)
+        return rules
@@ -0,0 +1,180 @@
+# rule_sql.py
+import sqlite3
+
+from rule_compiler import RuleCompiler
+
+def _affinity(declared_type):
+    """SQLite column affinity for a declared column type"""
+    declared_type = (declared_type or '').upper()
+    if 'INT' in declared_type:
+        return 'INTEGER'
+    if 'CHAR' in declared_type or 'CLOB' in declared_type or 'TEXT' in declared_type:
+        return 'TEXT'
+    if not declared_type or 'BLOB' in declared_type:
+        return 'BLOB'
+    if 'REAL' in declared_type or 'FLOA' in declared_type or 'DOUB' in declared_type:
+        return 'REAL'
+    return 'NUMERIC'
+
+def _quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+class SQLTranslator:
+    """
+    Translate a RuleNode tree into a parameterized SQLite WHERE clause.
+
+    A row matches when RuleEvaluator would return True for it as a dict
+    with NULL columns left out: a missing or NULL column never matches,
+    digit strings and non-negative integers compare as numbers, = and !=
+    compare string forms otherwise. Comparisons the evaluator would reject
+    (e.g. a number against a non-numeric string with >) don't match.
+
+    column_types maps column names to declared types. Columns declared
+    INTEGER or TEXT are assumed to hold only that type (as in a STRICT
+    table), which lets most conditions become plain indexable comparisons;
+    other columns get an exact but unindexable typeof() expression.
+    Conditions on columns not in column_types never match.
+    """
+    def __init__(self, column_types):
+        self.column_types = {name: _affinity(declared) for name, declared in column_types.items()}
+        self.compiler = RuleCompiler()
+
+    def translate(self, rule_node):
+        """Return (sql, params) for the rule"""
+        params = []
+        return self._translate_node(rule_node, params), params
+
+    def _translate_node(self, node, params):
+        if node.type == "operand":
+            return self._translate_condition(node.value, params)
+        if node.type != "operator" or node.value not in ('AND', 'OR') or not node.children:
+            return '0'
+        parts = [self._translate_node(child, params) for child in node.children]
+        return '(' + f' {node.value} '.join(parts) + ')'
+
+    def _translate_condition(self, condition, params):
+        parsed = self.compiler.parse_condition(condition)
+        if parsed is None or parsed.field not in self.column_types:
+            return '0'
+
+        column = _quote_identifier(parsed.field)
+        op = parsed.operator
+        stringify = op in ('=', '!=')
+        affinity = self.column_types[parsed.field]
+
+        if affinity == 'INTEGER':
+            if parsed.number is not None:
+                params.append(parsed.number)
+                if stringify:
+                    return f'{column} {op} ?'
+                # Negative numbers would be compared with a string
+                return f'({column} >= 0 AND {column} {op} ?)'
+            if stringify:
+                params.append(parsed.value)
+                return f'CAST({column} AS TEXT) {op} ?'
+            return '0'
+
+        if affinity == 'TEXT' and parsed.number is None:
+            params.append(parsed.value)
+            return f'{column} {op} ?'
+
+        # Exact form for any storage class
+        if parsed.number is not None:
+            params.extend([parsed.number, parsed.number, parsed.value])
+            real_result = '1' if op == '!=' else '0'
+            integer_test = f'{column} {op} ?' if stringify else f'{column} >= 0 AND {column} {op} ?'
+            return (f"(CASE typeof({column})"
+                    f" WHEN 'integer' THEN {integer_test}"
+                    f" WHEN 'text' THEN CASE WHEN {column} <> '' AND {column} NOT GLOB '*[^0-9]*'"
+                    f" THEN CAST({column} AS INTEGER) {op} ? ELSE {column} {op} ? END"
+                    f" WHEN 'real' THEN {real_result}"
+                    f" ELSE 0 END)")
+
+        if stringify:
+            params.extend([parsed.value] * 3)
+            return (f"(CASE typeof({column})"
+                    f" WHEN 'text' THEN {column} {op} ?"
+                    f" WHEN 'integer' THEN CAST({column} AS TEXT) {op} ?"
+                    f" WHEN 'real' THEN CAST({column} AS TEXT) {op} ?"
+                    f" ELSE 0 END)")
+        params.append(parsed.value)
+        return f"(typeof({column}) = 'text' AND {column} {op} ?)"
+
+class RuleQuery:
+    """Run rules as SQL against a table of user records in SQLite"""
+    def __init__(self, db_name, table='users'):
+        self.db_name = db_name
+        self.table = table
+        self.conn = sqlite3.connect(db_name, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+
+    def close(self):
+        self.conn.close()
+
+    def column_types(self):
+        rows = self.conn.execute(f'PRAGMA table_info({_quote_identifier(self.table)})').fetchall()
+        return {row['name']: row['type'] for row in rows}
+
+    def translate(self, rule_node):
+        return SQLTranslator(self.column_types()).translate(rule_node)
+
+    def find_matching(self, rule_node, columns='*'):
+        """Return matching rows as dicts"""
+        where, params = self.translate(rule_node)
+        cursor = self.conn.execute(f'SELECT {columns} FROM {_quote_identifier(self.table)} WHERE {where}', params)
+        return [dict(row) for row in cursor]
+
+    def count_matching(self, rule_node):
+        where, params = self.translate(rule_node)
+        cursor = self.conn.execute(f'SELECT COUNT(*) FROM {_quote_identifier(self.table)} WHERE {where}', params)
+        return cursor.fetchone()[0]
+
+    def _indexed_columns(self):
+        """Columns that already lead an index"""
+        indexed = set()
+        table = _quote_identifier(self.table)
+        for index in self.conn.execute(f'PRAGMA index_list({table})').fetchall():
+            info = self.conn.execute(f'PRAGMA index_info({_quote_identifier(index["name"])})').fetchall()
+            if info:
+                indexed.add(info[0]['name'])
+        return indexed
+
+    def advise_indexes(self, rule_node):
+        """
+        Return CREATE INDEX statements for columns whose conditions the
+        translator emits as plain comparisons and that no index leads yet
+        """
+        column_types = self.column_types()
+        translator = SQLTranslator(column_types)
+        indexed = self._indexed_columns()
+
+        counts = {}
+        stack = [rule_node]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.children)
+            if node.type != "operand":
+                continue
+            parsed = translator.compiler.parse_condition(node.value)
+            if parsed is None or parsed.field not in column_types or parsed.field in indexed:
+                continue
+            affinity = translator.column_types[parsed.field]
+            if (affinity == 'INTEGER' and parsed.number is not None) or (affinity == 'TEXT' and parsed.number is None):
+                counts[parsed.field] = counts.get(parsed.field, 0) + 1
+
+        statements = []
+        for column in sorted(counts, key=lambda column: -counts[column]):
+            index_name = _quote_identifier(f'idx_{self.table}_{column}')
+            statements.append(
+                f'CREATE INDEX IF NOT EXISTS {index_name} ON {_quote_identifier(self.table)} ({_quote_identifier(column)})')
+        return statements
+
+    def create_indexes(self, rule_node):
+        """Create the indexes advise_indexes recommends; returns the statements run"""
+        statements = self.advise_indexes(rule_node)
+        with self.conn:
+            for statement in statements:
+                self.conn.execute(statement)
+            if statements:
+                self.conn.execute('ANALYZE')
+        return statements
@@ -0,0 +1,71 @@
+# rule_stream.py
+import json
+import time
+
+from rule_cost import BudgetExceeded
+
+class NDJSONEvaluator:
+    """
+    Evaluate newline-delimited JSON records as their bytes arrive.
+
+    Only the current chunk and one partial line are held at a time, so
+    memory stays flat however large the input is. Each record produces one
+    output line with the result of every rule, in the order the rules were
+    given; the last line summarises the run with its records/sec.
+    """
+    def __init__(self, compiled_rules, max_line_bytes=1024 * 1024):
+        self.compiled_rules = compiled_rules
+        self.max_line_bytes = max_line_bytes
+
+    def _evaluate_line(self, index, line):
+        """Return (output line, whether the record failed)"""
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("record must be a JSON object")
+            results = ','.join('true' if rule.evaluate(record) else 'false' for rule in self.compiled_rules)
+            return f'{{"index":{index},"results":[{results}]}}\n', False
+        except (ValueError, TypeError) as e:
+            return json.dumps({"index": index, "error": str(e)}) + '\n', True
+        except BudgetExceeded as e:
+            return json.dumps({"index": index, "aborted": str(e)}) + '\n', True
+
+    async def evaluate_stream(self, chunks):
+        """Consume an async iterator of bytes and yield encoded result lines"""
+        start = time.perf_counter()
+        index = 0
+        errors = 0
+        pending = b''
+
+        async for chunk in chunks:
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            if len(pending) > self.max_line_bytes:
+                yield json.dumps({"index": index, "error": f"record longer than {self.max_line_bytes} bytes"}).encode() + b'\n'
+                return
+
+            output = []
+            for line in lines:
+                if not line.strip():
+                    continue
+                result, failed = self._evaluate_line(index, line)
+                errors += failed
+                output.append(result)
+                index += 1
+            if output:
+                yield ''.join(output).encode()
+
+        if pending.strip():
+            result, failed = self._evaluate_line(index, pending)
+            errors += failed
+            index += 1
+            yield result.encode()
+
+        elapsed = time.perf_counter() - start
+        summary = {
+            "records": index,
+            "errors": errors,
+            "elapsed_seconds": round(elapsed, 6),
+            "records_per_second": round(index / elapsed, 1) if elapsed > 0 else None
+        }
+        yield json.dumps({"summary": summary}).encode() + b'\n'
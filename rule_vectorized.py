@@ -0,0 +1,202 @@
+# rule_vectorized.py
+import numpy as np
+
+from rule_compiler import RuleCompiler
+
+class ColumnBatch:
+    """
+    Records stored as one NumPy array per field.
+
+    present maps a field to a boolean array marking the rows that have a
+    value for it; fields without an entry are present in every row. Values
+    in rows where a field is missing are placeholders and never compared.
+    """
+    def __init__(self, columns, length=None, present=None):
+        self.columns = {field: np.asarray(values) for field, values in columns.items()}
+        if length is None:
+            length = len(next(iter(self.columns.values()))) if self.columns else 0
+        self.length = length
+        self.present = present or {}
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a batch from a list of dicts like the ones RuleEvaluator takes"""
+        length = len(records)
+        fields = {}
+        for record in records:
+            for field in record:
+                fields.setdefault(field, None)
+
+        columns = {}
+        present = {}
+        for field in fields:
+            rows = [i for i, record in enumerate(records) if field in record]
+            values = [records[i][field] for i in rows]
+            column = _to_array(values)
+            if len(rows) < length:
+                full = np.zeros(length, dtype=column.dtype)
+                if column.dtype == object:
+                    full[:] = None
+                full[rows] = column
+                column = full
+                mask = np.zeros(length, dtype=bool)
+                mask[rows] = True
+                present[field] = mask
+            columns[field] = column
+        return cls(columns, length, present)
+
+def _to_array(values):
+    """Pick a typed array only when every value has the same Python type"""
+    kinds = {type(value) for value in values}
+    if kinds == {int}:
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            pass
+    elif kinds == {str}:
+        return np.array(values, dtype=str)
+
+    # Mixed, bool, float and other types keep their Python objects so the
+    # per-value fallback sees exactly what the scalar evaluator would
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+class VectorizedRule:
+    """A RuleNode tree prepared for evaluation over a ColumnBatch"""
+    def __init__(self, ast, conditions):
+        self.ast = ast
+        self.conditions = conditions    # Operand node value -> Condition (or None)
+
+class VectorizedEvaluator:
+    """
+    Evaluate a rule over whole columns at once.
+
+    Each condition becomes a boolean mask and AND/OR become & and |. Results
+    match RuleEvaluator.evaluate_rule row for row: a missing field never
+    matches, digit strings and non-negative integers compare as numbers,
+    and anything the scalar evaluator would compare differently (floats,
+    bools, negative numbers, mixed columns) is compared value by value
+    with the same coercion RuleCompiler uses. Conditions on fields typed by
+    schema compare int and str columns directly with the converted literal.
+    """
+    def __init__(self, schema=None):
+        self.compiler = RuleCompiler(schema)
+
+    def compile_rule(self, rule_node):
+        """Resolve every condition of the rule once"""
+        conditions = {}
+        stack = [rule_node]
+        while stack:
+            node = stack.pop()
+            if node.type == "operand" and node.value not in conditions:
+                conditions[node.value] = self.compiler.parse_condition(node.value)
+            stack.extend(node.children)
+        return VectorizedRule(rule_node, conditions)
+
+    def evaluate(self, rule, batch):
+        """Return a boolean array with one result per row of the batch"""
+        if not isinstance(rule, VectorizedRule):
+            rule = self.compile_rule(rule)
+
+        # Same post-order walk as RuleEvaluator.evaluate_rule, on masks
+        results = []
+        stack = [(rule.ast, False)]
+        while stack:
+            node, children_done = stack.pop()
+
+            if node.type == "operand":
+                results.append(self._evaluate_condition(rule.conditions[node.value], batch))
+
+            elif node.type == "operator" and not children_done:
+                stack.append((node, True))
+                for child in reversed(node.children):
+                    stack.append((child, False))
+
+            elif node.type == "operator":
+                count = len(node.children)
+                child_masks = results[len(results) - count:]
+                del results[len(results) - count:]
+
+                if node.value == "AND" and child_masks:
+                    mask = child_masks[0].copy()
+                    for child_mask in child_masks[1:]:
+                        mask &= child_mask
+                elif node.value == "OR" and child_masks:
+                    mask = child_masks[0].copy()
+                    for child_mask in child_masks[1:]:
+                        mask |= child_mask
+                else:
+                    mask = np.full(batch.length, node.value == "AND")
+                results.append(mask)
+
+            else:
+                results.append(np.zeros(batch.length, dtype=bool))
+
+        return results[0]
+
+    def _evaluate_condition(self, condition, batch):
+        length = batch.length
+        if condition is None or condition.field not in batch.columns:
+            return np.zeros(length, dtype=bool)
+
+        column = batch.columns[condition.field]
+        present = batch.present.get(condition.field)
+
+        mask = None
+        kind = column.dtype.kind
+        if condition.kind is not None:
+            mask = self._compare_typed(condition, column)
+        elif kind in 'iu':
+            mask = self._compare_integers(condition, column, present)
+        elif kind == 'U':
+            mask = self._compare_strings(condition, column)
+
+        if mask is None:
+            return self._compare_values(condition, column, present)
+        if present is not None:
+            mask &= present
+        return mask
+
+    def _compare_typed(self, condition, column):
+        kind = column.dtype.kind
+        if (condition.kind in ('int', 'float') and kind in 'iu') or (condition.kind in ('str', 'date') and kind == 'U'):
+            return np.asarray(condition.compare(column, condition.literal), dtype=bool)
+        return None        # Other types go value by value, which rejects mismatches
+
+    def _compare_integers(self, condition, column, present):
+        negative = column < 0
+        if present is not None:
+            negative &= present
+        if negative.any():
+            return None    # str(-5) isn't a digit string; compare value by value
+
+        if condition.number is not None:
+            return condition.compare(column, condition.number)
+        if condition.operator in ('=', '!='):
+            return condition.compare(column.astype(str), condition.value)
+        return None        # int vs string ordering raises in the scalar evaluator
+
+    def _compare_strings(self, condition, column):
+        if condition.number is None:
+            return np.asarray(condition.compare(column, condition.value), dtype=bool)
+
+        # Digit strings compare as numbers, everything else as strings
+        digits = np.char.isdigit(column)
+        mask = np.asarray(condition.compare(column, condition.value), dtype=bool)
+        if digits.any():
+            try:
+                numbers = column[digits].astype(np.int64)
+            except (ValueError, OverflowError):
+                return None
+            mask[digits] = condition.compare(numbers, condition.number)
+        return mask
+
+    def _compare_values(self, condition, column, present):
+        """Per-value fallback using the scalar coercion rules"""
+        matches = condition.value_matcher()
+        mask = np.zeros(len(column), dtype=bool)
+        rows = range(len(column)) if present is None else np.flatnonzero(present)
+        for i in rows:
+            mask[i] = matches(column[i])
+        return mask
@@ -1,8 +1,16 @@
 // static/script.js
 async function loadRules() {
     try {
-        const response = await fetch('/api/rules/');
-        const rules = await response.json();
+        // Follow the Link header through every page; unchanged pages are
+        // revalidated with their ETag
+        let rules = [];
+        let url = '/api/rules/?limit=1000';
+        while (url) {
+            const response = await fetch(url);
+            rules = rules.concat(await response.json());
+            const next = /<([^>]+)>;\s*rel="next"/.exec(response.headers.get('Link') || '');
+            url = next ? next[1] : null;
+        }
         
         // Update rules list
         const rulesList = document.getElementById('rulesList');